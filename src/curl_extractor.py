@@ -1,4 +1,11 @@
-def extract_curl_data(file_path: str = "assets/headers.txt") -> tuple[str, dict[str, str]]:
+import os
+
+HEADERS_PATH = os.path.join("assets", "headers.txt")
+
+
+def extract_curl_data(file_path: str | None = None) -> tuple[str, dict[str, str]]:
+    if file_path is None:
+        file_path = HEADERS_PATH
     endpoint = ""
     headers = {}
     data = {}
@@ -1,67 +1,321 @@
-from dotenv import load_dotenv
-import os
+from collections import OrderedDict
+from contextlib import contextmanager
+import csv
+import io
 import sqlalchemy as sql
 from sqlalchemy import create_engine, Engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm.attributes import set_committed_value
+import threading
 import time
+from typing import Iterable
 
 from espn import get_matchup_timestamps
-from sleeper import get_rosters
-from sql_tables import Base, ManagerScore, Player, Manager, Transaction, Roster
+from league_cache import get_league_cache
+from metrics import instrument_engine
+from lineup import BENCH_NOTICE, latest_lineups
+from simulation import latest_odds
+from settings import Settings, get_settings
+from sleeper import SEASON, get_rosters, get_week
+from snapshot import RefreshSnapshot, build_snapshot
+from sql_tables import Base, IngestionWatermark, ManagerScore, Player, Manager, Transaction, Roster, RosterPlayer, ROSTER_COMPARISON_FIELDS, roster_player_flags
+from timeseries import COMPACTION_STREAM, ScoreSeries, compact_scores, score_series
+
+# How long anything waits on a league's lock before giving up, under main's COMMAND_TIMEOUT
+LOCK_TIMEOUT = 20.0
+
+def _copy_value(value):
+    """
+    Format a value for a CSV COPY, empty fields are read back as NULL
+    """
+    if value is None:
+        return None
+    if isinstance(value, list):
+        escaped = [str(v).replace("\\", "\\\\").replace('"', '\\"') for v in value]
+        return "{" + ",".join(f'"{v}"' for v in escaped) + "}"
+    return value
+
+
+class IdentityCache:
+    """
+    Size bounded id -> ORM object map. The least recently used entries are evicted first.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
 
 class DatabaseHelper:
-    def __init__(self):
+    def __init__(self, league_id: str | None = None, db_schema: str | None = None, player_cache_size: int = 4096, settings: Settings | None = None):
+        self.settings = get_settings() if settings is None else settings
+        self.league_id = self.settings.league_id if league_id is None else league_id
+        self.db_schema = db_schema
+        # The session isn't thread safe, everything that uses it from the worker pool holds this.
+        # Reentrant so a task already holding it can call methods that take it again.
+        self.lock = threading.RLock()
         self.db_session: Session = None
-        self.db_engine: Engine = self.create_engine()
+        self.db_engine: Engine = self.create_engine(db_schema=db_schema)
+        instrument_engine(self.db_engine)
         self.db_metadata = sql.MetaData()
-        self.db_metadata.reflect(bind=self.db_engine)
+        self.db_metadata.reflect(bind=self.db_engine, schema=db_schema)
         Base.metadata.create_all(self.db_engine)
+        self.add_missing_schema()
+        get_league_cache().attach(self.db_engine, self.league_id)
+
+        self.player_cache = IdentityCache(player_cache_size)
+        self.manager_cache = IdentityCache(256)
+        # Newest refreshed_on / news_updated seen, anything past these has changed since it was cached
+        self.players_refreshed_on = 0
+        self.players_news_updated = 0
+        # (season, week) roster_players was last brought fully in line for
+        self.roster_players_synced: tuple[int, int] | None = None
 
-    def create_engine(self, drivername: str="postgresql", port: int=5432, host: str="localhost", db_name: str="sleeper_db") -> Engine:
-        load_dotenv()
+    @contextmanager
+    def locked(self, timeout: float = LOCK_TIMEOUT):
+        """
+        Hold the league's lock around session reads and writes, e.g. with self.db.locked(): ...
+        Raises TimeoutError if another task has had it for longer than timeout.
+        """
+        if not self.lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Waited {timeout}s for the {self.league_id} database")
+        try:
+            yield
+        finally:
+            self.lock.release()
+
+    def add_missing_schema(self) -> None:
+        """
+        create_all only creates missing tables, so columns and indexes added to an existing
+        table get added here. New columns must be nullable for this to work.
+        """
+        with self.db_engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                table_name = table.name if self.db_schema is None else f"{self.db_schema}.{table.name}"
+                reflected = self.db_metadata.tables.get(table_name)
+                if reflected is None:
+                    continue
+                for column in table.columns:
+                    if column.name not in reflected.columns:
+                        column_type = column.type.compile(dialect=self.db_engine.dialect)
+                        qualified = table.name if self.db_schema is None else f'"{self.db_schema}".{table.name}'
+                        conn.execute(sql.text(f'ALTER TABLE {qualified} ADD COLUMN IF NOT EXISTS "{column.name}" {column_type}'))
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+    def create_engine(self, drivername: str="postgresql", db_schema: str | None = None) -> Engine:
+        """
+        With a db_schema each league gets its own copy of every table without any of the queries
+        having to know about it. The ORM and create_all put the schema on every table through
+        schema_translate_map. The search path alone isn't enough, a table that already exists in
+        public would be found there instead of being created in the league's schema. The search
+        path is still set (without public) for the few raw SQL statements.
+        """
         db_url = sql.URL.create(
             drivername=drivername,
-            username=os.getenv("SLEEPER_DB_USERNAME"),
-            password=os.getenv("SLEEPER_DB_PASSWORD"),
-            host=host,
-            port=port,
-            database=db_name
+            username=self.settings.db_username,
+            password=self.settings.db_password,
+            host=self.settings.db_host,
+            port=self.settings.db_port,
+            database=self.settings.db_name
         )
-        _engine = create_engine(db_url)
-        _session = sessionmaker(_engine)
+        if db_schema is None:
+            _engine = create_engine(db_url)
+        else:
+            # Created before the league's engine first connects, so its search path points at something that exists
+            _setup_engine = create_engine(db_url)
+            with _setup_engine.begin() as conn:
+                conn.execute(sql.text(f'CREATE SCHEMA IF NOT EXISTS "{db_schema}"'))
+            _setup_engine.dispose()
+            _engine = create_engine(db_url, connect_args={"options": f"-csearch_path={db_schema}"})
+            _engine = _engine.execution_options(schema_translate_map={None: db_schema})
+        # Cached players and managers are reused across commits, so don't expire them on every commit
+        _session = sessionmaker(_engine, expire_on_commit=False)
         self.db_session = _session()
         return _engine
 
+    def sync_players(self, player_rows: Iterable[dict], batch_size: int = 5000) -> dict[str, int | float]:
+        """
+        Bulk load player rows (see sql_tables.player_row) into a staging table and upsert them
+        into players in one statement. Rows whose content_hash didn't change aren't touched, so
+        this is cheap and safe to re-run.
+        """
+        start = time.perf_counter()
+        players = Player.__table__
+        columns = [column.name for column in players.columns]
+        connection = self.db_session.connection()
+        connection.execute(sql.text("CREATE TEMP TABLE players_staging (LIKE players INCLUDING DEFAULTS) ON COMMIT DROP"))
+        staging = sql.table("players_staging", *[sql.column(name) for name in columns])
+
+        total = 0
+        batch = []
+        for row in player_rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self._load_staging(connection, staging, columns, batch)
+                total += len(batch)
+                batch = []
+        if len(batch) > 0:
+            self._load_staging(connection, staging, columns, batch)
+            total += len(batch)
+        load_time = time.perf_counter() - start
+
+        stmt = pg_insert(players).from_select(columns, sql.select(staging))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[players.c.player_id],
+            set_={name: stmt.excluded[name] for name in columns if name != "player_id"},
+            where=players.c.content_hash.is_distinct_from(stmt.excluded.content_hash)
+        )
+        # xmax is 0 for freshly inserted rows and set for rows that were updated
+        stmt = stmt.returning(sql.literal_column("xmax = 0"))
+        results = connection.execute(stmt).scalars().all()
+        self.db_session.commit()
+        self.player_cache.clear()
+
+        inserted = sum(1 for r in results if r)
+        updated = len(results) - inserted
+        summary = {
+            "total": total,
+            "inserted": inserted,
+            "updated": updated,
+            "unchanged": total - inserted - updated,
+            "load_seconds": round(load_time, 3),
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+        print(f"Synced {total} players in {summary['seconds']}s: {inserted} new, {updated} updated, {summary['unchanged']} unchanged")
+        return summary
+
+    @staticmethod
+    def _load_staging(connection: sql.Connection, staging: sql.TableClause, columns: list[str], rows: list[dict]) -> None:
+        dbapi_connection = connection.connection.dbapi_connection
+        cursor = dbapi_connection.cursor()
+        if not hasattr(cursor, "copy_expert"):
+            # Not psycopg2, fall back to a batched executemany
+            cursor.close()
+            connection.execute(sql.insert(staging), [{name: row.get(name) for name in columns} for row in rows])
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row.get(name)) for name in columns])
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY players_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.close()
+
+    def _cache_players(self, players: list[Player]) -> None:
+        for player in players:
+            self.player_cache.put(player.player_id, player)
+            self.players_refreshed_on = max(self.players_refreshed_on, player.refreshed_on or 0)
+            self.players_news_updated = max(self.players_news_updated, player.news_updated or 0)
+
+    def invalidate_stale_players(self) -> int:
+        """
+        Evict cached players that were refreshed or had news since they were cached. This only
+        returns the ids of changed rows, so it's cheap to run once per tick.
+        """
+        if len(self.player_cache) == 0:
+            return 0
+        q = self.db_session.query(Player.player_id)
+        q = q.where(sql.or_(Player.refreshed_on > self.players_refreshed_on, Player.news_updated > self.players_news_updated))
+        stale = [player_id for player_id, in q.all()]
+        for player_id in stale:
+            self.player_cache.pop(player_id)
+        return len(stale)
+
+    def prefetch_players(self, player_ids) -> None:
+        """
+        Load every player that isn't cached yet in a single query
+        """
+        missing = {player_id for player_id in player_ids if player_id is not None and player_id not in self.player_cache}
+        if len(missing) == 0:
+            return
+        q = self.db_session.query(Player)
+        q = q.where(Player.player_id.in_(missing))
+        # The session keeps its own copy of rows it has seen, make sure a reload actually overwrites it
+        q = q.populate_existing()
+        self._cache_players(q.all())
+
+    def prefetch_rostered_players(self) -> None:
+        """
+        Refresh the cache with every rostered player in the league
+        """
+        self.invalidate_stale_players()
+        player_ids = set()
+        for roster in self.get_rosters():
+            player_ids.update(roster.players or [])
+        self.prefetch_players(player_ids)
+
     def get_player(self, player_id) -> Player:
         """
         Get a player by their ID
         """
-        q = self.db_session.query(Player)
-        q = q.where(Player.player_id == player_id)
-        return q.first()
+        if player_id is None:
+            return None
+        player = self.player_cache.get(player_id)
+        if player is None:
+            self.prefetch_players([player_id])
+            player = self.player_cache.get(player_id)
+        return player
 
     def get_players_by_ids(self, player_ids: list[str]) -> list[Player]:
         """
         Pass a list of player IDs, get a list of corresponding player objects
         """
-        q = self.db_session.query(Player)
-        q = q.where(Player.player_id.in_(player_ids))
-        return q.all()
+        self.prefetch_players(player_ids)
+        players = [self.player_cache.get(player_id) for player_id in player_ids]
+        return [player for player in players if player is not None]
 
     def get_manager(self, manager_id) -> Manager:
         """
         Get a manager by their ID
         """
-        q = self.db_session.query(Manager)
-        q = q.where(Manager.manager_id == manager_id)
-        return q.first()
+        manager = self.manager_cache.get(manager_id)
+        if manager is None:
+            # There are only a handful of managers, so load them all the first time one is missing
+            self.get_all_managers()
+            manager = self.manager_cache.get(manager_id)
+        return manager
 
     def get_all_managers(self) -> list[Manager]:
         """
         Get a list of managers for the league.
         """
         q = self.db_session.query(Manager)
-        return q.all()
+        managers = q.all()
+        for manager in managers:
+            self.manager_cache.put(manager.manager_id, manager)
+        return managers
 
     def get_rosters(self) -> list[Roster]:
         """
@@ -79,6 +333,82 @@ class DatabaseHelper:
         q = q.add_columns(Roster)
         return q.all()
 
+    def get_rosters_with_player(self, player_id: str, season: int | None = None, week: int | None = None) -> list[RosterPlayer]:
+        """
+        Every roster/week a player has been on, newest first. Narrow it down with season and week.
+        """
+        q = self.db_session.query(RosterPlayer)
+        q = q.where(RosterPlayer.player_id == player_id)
+        if season is not None:
+            q = q.where(RosterPlayer.season == season)
+        if week is not None:
+            q = q.where(RosterPlayer.week == week)
+        q = q.order_by(RosterPlayer.season.desc(), RosterPlayer.week.desc())
+        return q.all()
+
+    def get_player_starter(self, player_id: str, season: int, week: int) -> Manager | None:
+        """
+        The manager who started a player in a given week, if anyone did.
+        """
+        q = self.db_session.query(Manager)
+        q = q.join(Roster, Roster.manager_id == Manager.manager_id)
+        q = q.join(RosterPlayer, RosterPlayer.roster_id == Roster.roster_id)
+        q = q.where(RosterPlayer.player_id == player_id)
+        q = q.where(RosterPlayer.season == season)
+        q = q.where(RosterPlayer.week == week)
+        q = q.where(RosterPlayer.starter.is_(True))
+        return q.first()
+
+    def get_roster_players(self, roster_id: int, season: int, week: int) -> list[RosterPlayer]:
+        """
+        A roster's players for a given week.
+        """
+        q = self.db_session.query(RosterPlayer)
+        q = q.where(RosterPlayer.season == season)
+        q = q.where(RosterPlayer.week == week)
+        q = q.where(RosterPlayer.roster_id == roster_id)
+        return q.all()
+
+    def sync_roster_players(self, rosters: list[Roster], season: int, week: int) -> int:
+        """
+        Bring roster_players for a week in line with the live rosters. Only the set differences
+        get written: added players are inserted, dropped ones deleted, starter/reserve changes
+        updated. Returns the number of rows written.
+        """
+        q = self.db_session.query(RosterPlayer.roster_id, RosterPlayer.player_id, RosterPlayer.starter, RosterPlayer.reserve)
+        q = q.where(RosterPlayer.season == season)
+        q = q.where(RosterPlayer.week == week)
+        stored: dict[int, dict[str, tuple[bool, bool]]] = {}
+        for roster_id, player_id, starter, reserve in q.all():
+            stored.setdefault(roster_id, {})[player_id] = (starter, reserve)
+
+        inserts, updates, deletes = [], [], []
+        for roster in rosters:
+            live = roster_player_flags(roster)
+            current = stored.get(roster.roster_id, {})
+            for player_id in live.keys() - current.keys():
+                starter, reserve = live[player_id]
+                inserts.append({"season": season, "week": week, "roster_id": roster.roster_id, "player_id": player_id, "starter": starter, "reserve": reserve})
+            for player_id in live.keys() & current.keys():
+                if live[player_id] != current[player_id]:
+                    starter, reserve = live[player_id]
+                    updates.append({"season": season, "week": week, "roster_id": roster.roster_id, "player_id": player_id, "starter": starter, "reserve": reserve})
+            for player_id in current.keys() - live.keys():
+                deletes.append((roster.roster_id, player_id))
+
+        if len(inserts) > 0:
+            self.db_session.execute(sql.insert(RosterPlayer), inserts)
+        if len(updates) > 0:
+            # ORM bulk UPDATE by primary key, one executemany
+            self.db_session.execute(sql.update(RosterPlayer), updates)
+        if len(deletes) > 0:
+            stmt = sql.delete(RosterPlayer)
+            stmt = stmt.where(RosterPlayer.season == season)
+            stmt = stmt.where(RosterPlayer.week == week)
+            stmt = stmt.where(sql.tuple_(RosterPlayer.roster_id, RosterPlayer.player_id).in_(deletes))
+            self.db_session.execute(stmt)
+        return len(inserts) + len(updates) + len(deletes)
+
     def get_transactions_by_week(self, week: int) -> list[Transaction]:
         """
         Get a list of databased transactions for a given week.
@@ -87,33 +417,107 @@ class DatabaseHelper:
         q = q.where(Transaction.week == week)
         return q.all()
 
+    def get_watermark(self, league_id: str, stream: str) -> IngestionWatermark:
+        """
+        Get (or start) the high-water mark of an ingestion stream for a league
+        """
+        watermark = self.db_session.get(IngestionWatermark, (league_id, stream))
+        if watermark is None:
+            watermark = IngestionWatermark(league_id, stream, value=0)
+            self.db_session.add(watermark)
+        return watermark
+
+    def ingest_transactions(self, transactions: list[Transaction], league_id: str, week: int) -> list[Transaction]:
+        """
+        Upsert the transactions that changed since the league's watermark in one statement and
+        move the watermark forward. Returns the transactions that just became complete, either
+        because they're new or because their status changed (e.g. a pending trade went through).
+        """
+        watermark = self.get_watermark(league_id, "transactions")
+        fresh = {int(_t.transaction_id): _t for _t in transactions if (_t.status_updated or 0) > (watermark.value or 0)}
+        watermark.week = max(watermark.week or 0, week)
+        watermark.updated_on = int(time.time())
+        if len(fresh) == 0:
+            self.db_session.commit()
+            return []
+
+        q = self.db_session.query(Transaction.transaction_id, Transaction.status)
+        q = q.where(Transaction.transaction_id.in_(fresh.keys()))
+        previous_status = {int(transaction_id): status for transaction_id, status in q.all()}
+
+        table = Transaction.__table__
+        rows = []
+        for transaction_id, _t in fresh.items():
+            _t.league_id = league_id
+            rows.append({column.name: getattr(_t, column.name) for column in table.columns})
+        stmt = pg_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.transaction_id],
+            set_={column.name: stmt.excluded[column.name] for column in table.columns if column.name != "transaction_id"},
+            where=table.c.status_updated.is_distinct_from(stmt.excluded.status_updated)
+        )
+        self.db_session.connection().execute(stmt)
+        watermark.value = max(watermark.value or 0, max(_t.status_updated or 0 for _t in fresh.values()))
+        self.db_session.commit()
+
+        return [
+            _t for transaction_id, _t in fresh.items()
+            if _t.status == "complete" and previous_status.get(transaction_id) != "complete"
+        ]
+
+    def prefetch_transactions(self, transactions: list[Transaction]) -> None:
+        """
+        Load every player in a batch of transactions at once, before displaying them one by one
+        """
+        player_ids = set()
+        for transaction in transactions:
+            player_ids.update(transaction.players_added or [])
+            player_ids.update(transaction.players_dropped or [])
+        self.prefetch_players(player_ids)
+
     def display_transaction(self, transaction: Transaction):
         manager = self.get_manager(transaction.manager_id)
-        add_player = self.get_player(transaction.player_added)
-        drop_player = self.get_player(transaction.player_dropped)
-        top_line = f"{manager.display_name}\n"                              
-        mid_line = f"  + {add_player}\n"
-        bot_line = f"  \\- {drop_player}"
+        top_line = f"{manager.display_name}\n"
         if transaction.transaction_type == "waiver" and transaction.status == "complete":
             top_line = f"{manager.display_name} (${transaction.waiver_bid})\n"
         elif transaction.transaction_type == "waiver" and transaction.status == "failed":
             return ""
-        return top_line + mid_line + bot_line
+        lines = [f"  + {self.get_player(player_id)}" for player_id in transaction.players_added or []]
+        lines += [f"  \\- {self.get_player(player_id)}" for player_id in transaction.players_dropped or []]
+        return top_line + "\n".join(lines)
+
+    def get_score_series(self, start: int | None = None, end: int | None = None, manager_ids: list[int] | None = None, windows: list[tuple[int, int]] | None = None) -> dict[int, ScoreSeries]:
+        return score_series(self.db_session, start, end, manager_ids, windows)
+
+    def compact_score_history(self) -> int:
+        """
+        Thin out score history that's past the live window, see timeseries.compact_scores
+        """
+        watermark = self.get_watermark(self.league_id, COMPACTION_STREAM)
+        deleted = compact_scores(self.db_session, watermark)
+        if deleted > 0:
+            print(f"Compacted {deleted} old manager scores")
+        return deleted
 
     def display_roster(self, roster: Roster, manager: Manager | None = None):
         if manager is None:
             manager = self.get_manager(roster.manager_id)
-        q = self.db_session.query(Manager)
-        q = q.where(Manager.manager_id == roster.manager_id)
-        q = q.join(ManagerScore, ManagerScore.manager_id == Manager.manager_id)
+        q = self.db_session.query(ManagerScore)
+        q = q.where(ManagerScore.manager_id == roster.manager_id)
         q = q.order_by(ManagerScore.timestamp.desc())
-        q = q.add_columns(ManagerScore)
-        manager, manager_score = q.first()
+        manager_score = q.first()
 
         players = self.get_players_by_ids(roster.players)
         player_map: dict[int, Player] = {player.player_id: player for player in players}
 
         display_roster = f"## **{manager.team_name}** ({manager_score.current_score:.2f} / *{manager_score.projected_score:.2f}*)\n"
+        odds = latest_odds(self.league_id).get(roster.roster_id)
+        if odds is not None:
+            opponent = self.get_manager(odds.opponent_manager_id)
+            display_roster += f"{odds.win_probability:.0%} to beat {opponent.team_name}, likely {odds.low:.0f} to {odds.high:.0f}\n"
+        lineup = latest_lineups(self.league_id).get(roster.roster_id)
+        if lineup is not None and lineup.points_left >= BENCH_NOTICE:
+            display_roster += f"{lineup.points_left:.1f} projected points left on the bench, see !optimal -{manager.display_name}\n"
         for player in roster.starters:
             try:
                 display_roster += f"{player_map[player]}\n"
@@ -128,59 +532,58 @@ class DatabaseHelper:
                 display_roster += f"[    ] - Empty\n"
         return display_roster
 
-    def update_rosters(self, rosters: list[Roster] | None = None, commit: bool = True) -> str | None:
-        if rosters is None: 
-            live_rosters = get_rosters()
-        else:
+    def update_rosters(self, rosters: list[Roster] | None = None, commit: bool = True, snapshot: RefreshSnapshot | None = None) -> str | None:
+        if rosters is not None:
             live_rosters = rosters
-        db_rosters = self.get_rosters()
+        elif snapshot is not None:
+            live_rosters = snapshot.rosters
+        else:
+            live_rosters = get_rosters(self.league_id)
+        db_rosters = {db_roster.roster_id: db_roster for db_roster in self.get_rosters()}
         refresh_time = int(time.time())
+        # Any late swap check below then reads players from the cache
+        self.prefetch_players({player_id for roster in live_rosters for player_id in (roster.players or [])})
 
-        comparison_fields = [
-            "players",
-            "starters",
-            "reserve",
-            "streak",
-            "wins",
-            "losses",
-            "ties",
-            "points_for",
-            "points_against",
-            "potential_points",
-            "total_moves",
-            "waiver_budget_used"
-        ]
         late_starter_str = ""
+        changed_rosters: list[tuple[Roster, Roster]] = []
+        new_rosters = False
         for live_roster in live_rosters:
-            compared_roster = False
-            for db_roster in db_rosters:
-                if live_roster.roster_id == db_roster.roster_id:
-                    compared_roster = True 
-                    differing_fields = []
-                    identical = True 
-                    for field in comparison_fields:
-                        if not getattr(live_roster, field) == getattr(db_roster, field):
-                            differing_fields.append(field)
-
-                    if "starters" in differing_fields:
-                        live_starters = set(live_roster.starters)
-                        db_starters = set(db_roster.starters)
-                        started = live_starters.difference(db_starters)
-                        benched = db_starters.difference(live_starters)
-                        try:
-                            late_starter_str += self.check_late_starter_swap(started, benched, live_roster.manager_id)
-                        except Exception:
-                            # This is a non-critical part of the code. We never want to block on this.
-                            # TODO: Should setup a real logger and add logging here
-                            print(f"Failed to check late starter swap for manager {live_roster.manager_id}")
-                            pass
-
-                    for field in differing_fields:
-                        setattr(db_roster, field, getattr(live_roster, field))
-                        db_roster.refreshed_on = refresh_time
-            if not compared_roster:
+            db_roster = db_rosters.get(live_roster.roster_id)
+            if db_roster is None:
                 # Means there's nothing matching in the DB
                 self.db_session.add(live_roster)
+                new_rosters = True
+                continue
+            if db_roster.fingerprint == live_roster.fingerprint:
+                continue
+            changed_rosters.append((db_roster, live_roster))
+
+            if live_roster.starters != db_roster.starters:
+                live_starters = set(live_roster.starters)
+                db_starters = set(db_roster.starters)
+                started = live_starters.difference(db_starters)
+                benched = db_starters.difference(live_starters)
+                try:
+                    if snapshot is None:
+                        # Only fetch the scoreboard once no matter how many rosters changed
+                        snapshot = build_snapshot(league_id=self.league_id)
+                    late_starter_str += self.check_late_starter_swap(started, benched, live_roster.manager_id, snapshot=snapshot)
+                except Exception:
+                    # This is a non-critical part of the code. We never want to block on this.
+                    # TODO: Should setup a real logger and add logging here
+                    print(f"Failed to check late starter swap for manager {live_roster.manager_id}")
+                    pass
+
+        if len(changed_rosters) > 0:
+            self._write_rosters(changed_rosters, refresh_time)
+
+        # New rosters have to exist before roster_players can point at them
+        self.db_session.flush()
+        # Sleeper's week is the NFL week, the same for every league, so only asked for without a snapshot
+        week = snapshot.week if snapshot is not None else get_week()
+        if len(changed_rosters) > 0 or new_rosters or self.roster_players_synced != (int(SEASON), week):
+            self.sync_roster_players(live_rosters, int(SEASON), week)
+            self.roster_players_synced = (int(SEASON), week)
 
         if commit:
             self.db_session.commit()
@@ -188,8 +591,29 @@ class DatabaseHelper:
         if len(late_starter_str) > 0:
             return late_starter_str
 
-    def check_late_starter_swap(self, started_ids, benched_ids, manager_id, late_starter_threshold: int = 600):
-        matchup_timestamps = get_matchup_timestamps()
+    def _write_rosters(self, changed_rosters: list[tuple[Roster, Roster]], refresh_time: int) -> None:
+        """
+        Write every changed roster in one executemany UPDATE, and bring the in-session
+        copies up to date without marking them dirty so they don't get flushed again.
+        """
+        rosters = Roster.__table__
+        fields = ROSTER_COMPARISON_FIELDS + ["fingerprint", "refreshed_on"]
+        rows = []
+        for db_roster, live_roster in changed_rosters:
+            live_roster.refreshed_on = refresh_time
+            row = {field: getattr(live_roster, field) for field in fields}
+            row["b_roster_id"] = db_roster.roster_id
+            rows.append(row)
+            for field in fields:
+                set_committed_value(db_roster, field, row[field])
+        stmt = sql.update(rosters).where(rosters.c.roster_id == sql.bindparam("b_roster_id"))
+        self.db_session.connection().execute(stmt, rows)
+
+    def check_late_starter_swap(self, started_ids, benched_ids, manager_id, late_starter_threshold: int = 600, snapshot: RefreshSnapshot | None = None):
+        if snapshot is None:
+            matchup_timestamps = get_matchup_timestamps()
+        else:
+            matchup_timestamps = snapshot.scoreboard
         manager = self.get_manager(manager_id)
         started_players = self.get_players_by_ids(started_ids)
         benched_players = self.get_players_by_ids(benched_ids)
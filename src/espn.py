@@ -1,13 +1,21 @@
-from datetime import datetime
-import requests
+from datetime import datetime, timezone
 import re
 
+from http_client import AsyncHttpClient, get_json
+
+# https://github.com/stylo-stack/ESPN-API-Documentation/blob/master/endpoints.txt
+SCOREBOARD_URL = "http://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard"
+REGULAR_SEASON = 2
+# Kickoff to final whistle, with a bit of slack for overtime
+GAME_LENGTH = int(3.5 * 3600)
+
 def get_matchup_timestamps() -> dict[str, dict[str, datetime | bool | float]]:
-    # https://github.com/stylo-stack/ESPN-API-Documentation/blob/master/endpoints.txt
-    endpoint = "http://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard"
-    r = requests.get(endpoint)
-    response = r.json()
-    
+    return parse_scoreboard(get_json(SCOREBOARD_URL))
+
+async def get_matchup_timestamps_async(client: AsyncHttpClient) -> dict[str, dict[str, datetime | bool | float]]:
+    return parse_scoreboard(await client.get_json(SCOREBOARD_URL))
+
+def parse_scoreboard(response: dict) -> dict[str, dict[str, datetime | bool | float]]:
     split_regex = "@|VS"
     game_times = {}
     for event in response["events"]:
@@ -15,9 +23,10 @@ def get_matchup_timestamps() -> dict[str, dict[str, datetime | bool | float]]:
         teams = re.split(split_regex, event_name)
         event_datetime = event["date"].replace("T", " ").replace("Z", "")
         format_string = "%Y-%m-%d %H:%M"
-        event_datetime = datetime.strptime(event_datetime, format_string)
+        event_datetime = datetime.strptime(event_datetime, format_string).replace(tzinfo=timezone.utc)
         status = event.get("status", {})
-        in_progress = status.get("type", {}).get("state", False) in ["in", "post"]
+        state = status.get("type", {}).get("state", False)
+        in_progress = state in ["in", "post"]
         display_clock = status.get("displayClock", "0:00")
         quarter = status.get("period", 0)
         mins_seconds = [int(substr) for substr in display_clock.split(":")]
@@ -28,10 +37,41 @@ def get_matchup_timestamps() -> dict[str, dict[str, datetime | bool | float]]:
             game_times[team] = {
                 "timestamp": event_datetime.timestamp(),
                 "in_progress": in_progress,
+                "live": state == "in",
                 "time_remaining": time_remaining
             }
     return game_times
 
+def get_week_kickoffs(week: int, season: int | str) -> list[int]:
+    """
+    Kickoff times (epoch seconds) of every game in a regular season week, past weeks included
+    """
+    response = get_json(SCOREBOARD_URL, params={"dates": season, "seasontype": REGULAR_SEASON, "week": week})
+    return parse_kickoffs(response)
+
+def parse_kickoffs(response: dict) -> list[int]:
+    kickoffs = []
+    for event in response["events"]:
+        # ESPN dates are UTC, e.g. 2025-10-24T00:15Z
+        event_datetime = datetime.strptime(event["date"], "%Y-%m-%dT%H:%MZ").replace(tzinfo=timezone.utc)
+        kickoffs.append(int(event_datetime.timestamp()))
+    return sorted(kickoffs)
+
+def game_windows(kickoffs: list[int], game_length: int = GAME_LENGTH) -> list[tuple[int, int]]:
+    """
+    Merge kickoffs into the stretches of time where at least one game is being played
+    """
+    windows = []
+    for kickoff in sorted(kickoffs):
+        if len(windows) > 0 and kickoff <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], kickoff + game_length))
+        else:
+            windows.append((kickoff, kickoff + game_length))
+    return windows
+
+def get_game_windows(week: int, season: int | str) -> list[tuple[int, int]]:
+    return game_windows(get_week_kickoffs(week, season))
+
 if __name__ == "__main__":
     game_times = get_matchup_timestamps()
     for game, details in game_times.items():
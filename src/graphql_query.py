@@ -0,0 +1,56 @@
+import json
+
+
+class Variable:
+    """
+    Marks a field argument as a reference to a query variable, e.g. `week: $week`
+    """
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self) -> str:
+        return f"${self.name}"
+
+
+class GraphQLQuery:
+    """
+    Tiny query builder so payloads are assembled from parts and values travel as
+    variables instead of being escaped into the query text by hand.
+    """
+    def __init__(self, operation_name: str):
+        self.operation_name = operation_name
+        self.variable_types: dict[str, str] = {}
+        self.variables: dict[str, object] = {}
+        self.fields: list[tuple[str, str, dict[str, object], list[str]]] = []
+
+    def variable(self, name: str, gql_type: str, value: object) -> Variable:
+        self.variable_types[name] = gql_type
+        self.variables[name] = value
+        return Variable(name)
+
+    def field(self, alias: str, name: str, arguments: dict[str, object], selection: list[str]) -> "GraphQLQuery":
+        self.fields.append((alias, name, arguments, selection))
+        return self
+
+    @staticmethod
+    def _format_argument(value: object) -> str:
+        if isinstance(value, Variable):
+            return str(value)
+        # JSON literals are valid GraphQL literals for strings, numbers, bools and lists of them
+        return json.dumps(value)
+
+    def query(self) -> str:
+        parts = []
+        if len(self.variable_types) > 0:
+            declared = ", ".join(f"${name}: {gql_type}" for name, gql_type in self.variable_types.items())
+            parts.append(f"query {self.operation_name}({declared}) {{")
+        else:
+            parts.append(f"query {self.operation_name} {{")
+        for alias, name, arguments, selection in self.fields:
+            args = ", ".join(f"{key}: {self._format_argument(value)}" for key, value in arguments.items())
+            parts.append(f"  {alias}: {name}({args}) {{ {' '.join(selection)} }}")
+        parts.append("}")
+        return "\n".join(parts)
+
+    def payload(self) -> dict:
+        return {"operationName": self.operation_name, "query": self.query(), "variables": self.variables}
@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+import time
+from typing import Iterator
+
+from http_client import AsyncHttpClient, DEFAULT_TIMEOUT, get_session
+
+CACHE_DIR = os.path.join("assets", "cache")
+CHUNK_SIZE = 64 * 1024
+
+
+class DiskCache:
+    """
+    A gzipped response body on disk next to a small json file with its validators
+    (ETag / Last-Modified) and when it was fetched.
+    """
+    def __init__(self, name: str, cache_dir: str | None = None):
+        self.name = name
+        # Looked up on each use so the replay harness can point the cache somewhere else
+        self.cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+        self.body_path = os.path.join(self.cache_dir, f"{name}.json.gz")
+        self.meta_path = os.path.join(self.cache_dir, f"{name}.meta.json")
+
+    def meta(self) -> dict:
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def exists(self) -> bool:
+        return os.path.exists(self.body_path) and "fetched_on" in self.meta()
+
+    def age(self) -> float:
+        return time.time() - self.meta().get("fetched_on", 0)
+
+    def conditional_headers(self) -> dict[str, str]:
+        meta = self.meta()
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def version(self) -> int:
+        """
+        Identifies the body on disk, for telling whether something was built from this copy.
+        Caches written before stored_on was kept count as version 1.
+        """
+        return int(self.meta().get("stored_on") or 1)
+
+    def has_validators(self) -> bool:
+        return len(self.conditional_headers()) > 0
+
+    def iter_body(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with gzip.open(self.body_path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def read_body(self) -> bytes:
+        with gzip.open(self.body_path, "rb") as f:
+            return f.read()
+
+    def _write_meta(self, meta: dict) -> None:
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def touch(self) -> None:
+        """
+        The server said our copy is still good (304), so restart its clock
+        """
+        meta = self.meta()
+        meta["fetched_on"] = int(time.time())
+        self._write_meta(meta)
+
+    def store(self, url: str, headers, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        Write chunks to disk as they pass through. The new body only replaces the old one once
+        it has been read completely, so an interrupted download never leaves a half written cache.
+        A consumer that stops early (a streaming parser stops at the closing brace) still gets the
+        body cached, the rest of it is read when the generator is closed.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.body_path + ".tmp"
+        complete = False
+        try:
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                try:
+                    for chunk in chunks:
+                        f.write(chunk)
+                        yield chunk
+                except GeneratorExit:
+                    for chunk in chunks:
+                        f.write(chunk)
+            complete = True
+        finally:
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        os.replace(tmp_path, self.body_path)
+        self._write_meta({
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_on": int(time.time()),
+            # Unlike fetched_on a 304 doesn't move this, it's when this body was downloaded
+            "stored_on": int(time.time())
+        })
+
+
+def _use_disk(cache: DiskCache, ttl: float, prefer_disk: bool) -> bool:
+    if not cache.exists():
+        return False
+    if prefer_disk:
+        return True
+    # Without validators there's no cheap way to ask if it changed, so go by age
+    return not cache.has_validators() and cache.age() < ttl
+
+
+def open_cached(url: str, name: str, ttl: float, prefer_disk: bool = False) -> tuple[bool, Iterator[bytes]]:
+    """
+    Get a response body as chunks, from disk when possible. Returns (changed, chunks) where
+    changed is False when the body came from disk, so callers can skip reprocessing it.
+    """
+    cache = DiskCache(name)
+    if _use_disk(cache, ttl, prefer_disk):
+        return False, cache.iter_body()
+
+    headers = cache.conditional_headers() if cache.exists() else {}
+    r = get_session().get(url, headers=headers, timeout=DEFAULT_TIMEOUT, stream=True)
+    if r.status_code == 304:
+        r.close()
+        cache.touch()
+        return False, cache.iter_body()
+    r.raise_for_status()
+
+    def _chunks():
+        with r:
+            yield from cache.store(url, r.headers, r.iter_content(chunk_size=CHUNK_SIZE))
+    return True, _chunks()
+
+
+def get_cached_json(url: str, name: str, ttl: float, prefer_disk: bool = False):
+    _, chunks = open_cached(url, name, ttl, prefer_disk)
+    return json.loads(b"".join(chunks))
+
+
+async def get_cached_json_async(client: AsyncHttpClient, url: str, name: str, ttl: float, prefer_disk: bool = False):
+    cache = DiskCache(name)
+    if _use_disk(cache, ttl, prefer_disk):
+        return json.loads(cache.read_body())
+
+    headers = cache.conditional_headers() if cache.exists() else {}
+    async with client.session().get(url, headers=headers) as r:
+        if r.status == 304:
+            cache.touch()
+            return json.loads(cache.read_body())
+        r.raise_for_status()
+        body = await r.read()
+        for _ in cache.store(url, r.headers, iter([body])):
+            pass
+    return json.loads(body)
+
+
+def load_cached_json(name: str) -> tuple[int, object] | None:
+    """
+    Whatever is on disk for name as (fetched_on, value), without touching the network
+    """
+    cache = DiskCache(name)
+    if not cache.exists():
+        return None
+    return cache.meta()["fetched_on"], json.loads(cache.read_body())
@@ -0,0 +1,90 @@
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import observe_response, upstream_trace_config
+
+# Sleeper, ESPN and the GraphQL endpoint are the only hosts we talk to, so a
+# handful of keep-alive connections per host is plenty.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+DEFAULT_TIMEOUT = 15.0
+
+_session: requests.Session | None = None
+
+
+def get_session() -> requests.Session:
+    """
+    Get the process wide requests session. Connections are kept alive and reused
+    between calls instead of doing a new TCP + TLS handshake every request.
+    """
+    global _session
+    if _session is None:
+        retries = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retries)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(observe_response)
+        _session = session
+    return _session
+
+
+def get_json(url: str, params: dict | None = None, headers: dict | None = None, timeout: float = DEFAULT_TIMEOUT):
+    r = get_session().get(url, params=params, headers=headers, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+def iter_content(url: str, chunk_size: int = 64 * 1024, params: dict | None = None, headers: dict | None = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Stream a response body in chunks instead of reading it all into memory
+    """
+    with get_session().get(url, params=params, headers=headers, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        yield from r.iter_content(chunk_size=chunk_size)
+
+
+def post_json(url: str, headers: dict | None = None, data: str | None = None, json: dict | None = None, timeout: float = DEFAULT_TIMEOUT):
+    r = get_session().post(url, headers=headers, data=data, json=json, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+class AsyncHttpClient:
+    """
+    asyncio version of the pooled client so the discord tasks can await fetches
+    instead of blocking the event loop. The aiohttp session is created lazily
+    because it has to be made from inside a running loop.
+    """
+    def __init__(self, limit: int = POOL_MAXSIZE, timeout: float = DEFAULT_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[upstream_trace_config()]
+            )
+        return self._session
+
+    async def get_json(self, url: str, params: dict | None = None, headers: dict | None = None):
+        async with self.session().get(url, params=params, headers=headers) as r:
+            r.raise_for_status()
+            # Sleeper doesn't always send application/json, so don't let aiohttp check it
+            return await r.json(content_type=None)
+
+    async def post_json(self, url: str, headers: dict | None = None, data: str | None = None, json: dict | None = None):
+        async with self.session().post(url, headers=headers, data=data, json=json) as r:
+            r.raise_for_status()
+            return await r.json(content_type=None)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,85 @@
+import codecs
+import json
+from typing import Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _Buffer:
+    """
+    Text buffer fed from an iterable of byte chunks, only holding the part that hasn't been parsed yet
+    """
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """
+        Read another chunk, returns False once there's nothing left to read
+        """
+        if self.eof:
+            return False
+        # Drop what's already been parsed so the buffer stays around one chunk in size
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            text = self.utf8.decode(chunk)
+            if text:
+                self.text += text
+                return True
+        self.text += self.utf8.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at stream position {self.pos}, got {self.text[self.pos]!r}")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # A value that runs right up to the end of the buffer (e.g. a number) may be cut off
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_object_items(chunks: Iterable[bytes]) -> Iterator[tuple[str, object]]:
+    """
+    Incrementally parse a top level JSON object from byte chunks, yielding (key, value) pairs
+    as soon as each value is complete. Only one value is ever held in memory at a time.
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        return
+    while True:
+        key = buffer.decode()
+        buffer.expect(":")
+        yield key, buffer.decode()
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' in JSON object, got {separator!r}")
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+from sqlalchemy import Engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from http_client import AsyncHttpClient
+from scoring import CompiledScoring
+from sleeper import _parse_managers, _parse_waiver_weekday, get_league, get_league_async
+from sql_tables import LeagueMetadata, Manager
+
+# Scoring settings, roster positions and the user list barely change during a season
+LEAGUE_TTL = 24 * 3600
+
+
+class LeagueInfo:
+    """
+    A league's settings and users, with the scoring settings compiled once for the scoring engine
+    """
+    def __init__(self, league_id: str, league: dict, users: list[dict], fetched_on: int):
+        self.league_id = league_id
+        self.league = league
+        self.users = users
+        self.fetched_on = fetched_on
+        self._compiled_scoring: CompiledScoring | None = None
+
+    @property
+    def scoring_settings(self) -> dict:
+        return self.league["scoring_settings"]
+
+    @property
+    def roster_positions(self) -> list[str]:
+        return self.league.get("roster_positions", [])
+
+    @property
+    def settings(self) -> dict:
+        return self.league.get("settings", {})
+
+    @property
+    def waiver_weekday(self) -> int:
+        return _parse_waiver_weekday(self.league)
+
+    @property
+    def compiled_scoring(self) -> CompiledScoring:
+        if self._compiled_scoring is None:
+            self._compiled_scoring = CompiledScoring(self.scoring_settings)
+        return self._compiled_scoring
+
+    def managers(self) -> list[Manager]:
+        return _parse_managers(self.users)
+
+    def age(self, now: float | None = None) -> float:
+        return (time.time() if now is None else now) - self.fetched_on
+
+    def __repr__(self):
+        return f"LeagueInfo {self.league_id} ({self.league.get('name')}), fetched at {self.fetched_on}"
+
+
+class LeagueCache:
+    """
+    League metadata keyed by league_id: memory first, then the league_metadata table, then sleeper.
+    It uses its own short sessions on each league's engine rather than the bot's shared session,
+    so it's safe to call from the event loop and from the worker threads.
+    """
+    def __init__(self, ttl: float = LEAGUE_TTL):
+        self.ttl = ttl
+        self.engines: dict[str, Engine] = {}
+        self.leagues: dict[str, LeagueInfo] = {}
+        self.lock = threading.Lock()
+
+    def attach(self, engine: Engine, league_id: str) -> None:
+        """
+        Persist league_id's metadata through engine, i.e. in that league's schema
+        """
+        self.engines[league_id] = engine
+
+    def _is_fresh(self, league: LeagueInfo | None, now: float) -> bool:
+        return league is not None and league.age(now) < self.ttl
+
+    def _load(self, league_id: str) -> LeagueInfo | None:
+        engine = self.engines.get(league_id)
+        if engine is None:
+            return None
+        with Session(engine) as session:
+            row = session.get(LeagueMetadata, league_id)
+            if row is None:
+                return None
+            return LeagueInfo(league_id, row.league, row.users, row.fetched_on)
+
+    def _save(self, league: LeagueInfo) -> None:
+        engine = self.engines.get(league.league_id)
+        if engine is None:
+            return
+        row = LeagueMetadata(league.league_id, league.league, league.users, league.fetched_on)
+        values = {column.name: getattr(row, column.name) for column in LeagueMetadata.__table__.columns}
+        stmt = pg_insert(LeagueMetadata.__table__).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["league_id"],
+            set_={name: stmt.excluded[name] for name in values if name != "league_id"}
+        )
+        with Session(engine) as session:
+            session.execute(stmt)
+            session.commit()
+
+    def _store(self, league: LeagueInfo) -> LeagueInfo:
+        previous = self.leagues.get(league.league_id)
+        if previous is not None and previous.league == league.league:
+            # Unchanged settings keep their compiled scoring (and the same dict, which the
+            # snapshot's projected score reuse checks by identity)
+            league.league = previous.league
+            league._compiled_scoring = previous._compiled_scoring
+        self.leagues[league.league_id] = league
+        return league
+
+    def _cached(self, league_id: str, now: float) -> LeagueInfo | None:
+        league = self.leagues.get(league_id)
+        if self._is_fresh(league, now):
+            return league
+        stored = self._load(league_id)
+        if self._is_fresh(stored, now):
+            return self._store(stored)
+        return None
+
+    def get(self, league_id: str, force: bool = False) -> LeagueInfo:
+        now = time.time()
+        with self.lock:
+            league = None if force else self._cached(league_id, now)
+            if league is None:
+                league_document, users = get_league(league_id)
+                league = self._store(LeagueInfo(league_id, league_document, users, int(now)))
+                self._save(league)
+            return league
+
+    async def get_async(self, client: AsyncHttpClient, league_id: str, force: bool = False) -> LeagueInfo:
+        now = time.time()
+        league = self.leagues.get(league_id)
+        if not force and self._is_fresh(league, now):
+            return league
+        # Reading and writing Postgres blocks, so that part happens off the event loop
+        league = None if force else await asyncio.to_thread(self._cached, league_id, now)
+        if league is None:
+            league_document, users = await get_league_async(client, league_id)
+            league = self._store(LeagueInfo(league_id, league_document, users, int(now)))
+            await asyncio.to_thread(self._save, league)
+        return league
+
+    def invalidate(self, league_id: str | None = None) -> None:
+        """
+        Forget the in-memory copy so the next get goes back to the database (or sleeper, once it's stale)
+        """
+        if league_id is None:
+            self.leagues.clear()
+        else:
+            self.leagues.pop(league_id, None)
+
+
+_league_cache = LeagueCache()
+
+
+def get_league_cache() -> LeagueCache:
+    return _league_cache
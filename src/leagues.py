@@ -0,0 +1,66 @@
+import json
+import os
+
+from settings import Settings, get_settings, optional_int
+
+LEAGUES_PATH = os.path.join("assets", "leagues.json")
+
+
+class LeagueConfig:
+    """
+    Everything that differs between the leagues one bot process serves. Each league keeps its
+    tables in its own Postgres schema, db_schema None means the default (public) schema.
+    """
+    def __init__(self, league_id: str, name: str | None = None, db_schema: str | None = None, guild_id: int | None = None, general_channel_id: int | None = None, transactions_channel_id: int | None = None):
+        self.league_id = str(league_id)
+        self.name = name if name is not None else self.league_id
+        self.db_schema = db_schema
+        self.guild_id = guild_id
+        self.general_channel_id = general_channel_id
+        self.transactions_channel_id = transactions_channel_id
+
+    def channel_ids(self) -> set[int]:
+        return {channel_id for channel_id in [self.general_channel_id, self.transactions_channel_id] if channel_id is not None}
+
+    def __repr__(self):
+        return f"League {self.name} ({self.league_id}, schema {self.db_schema or 'public'})"
+
+
+def check_schemas(leagues: list[LeagueConfig]) -> None:
+    if len(leagues) < 2:
+        return
+    missing = [league.name for league in leagues if not league.db_schema]
+    if len(missing) > 0:
+        raise ValueError(f"Every league needs a db_schema when there's more than one, missing for {', '.join(missing)}")
+    schemas = [league.db_schema for league in leagues]
+    shared = sorted({schema for schema in schemas if schemas.count(schema) > 1})
+    if len(shared) > 0:
+        raise ValueError(f"Leagues can't share a db_schema, {', '.join(shared)} is used more than once")
+
+
+def load_leagues(path: str = LEAGUES_PATH, settings: Settings | None = None) -> list[LeagueConfig]:
+    """
+    The leagues listed in assets/leagues.json, for example
+        [{"league_id": "123", "name": "Work", "db_schema": "work", "guild_id": 1, "general_channel_id": 2, "transactions_channel_id": 3}]
+    Without that file it's the single league from the environment, like before. With more than
+    one league each needs a db_schema of its own, otherwise their rosters (roster_id 1 to N in every
+    league) would silently overwrite each other.
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            leagues = [LeagueConfig(
+                league_id = league["league_id"],
+                name = league.get("name"),
+                db_schema = league.get("db_schema"),
+                guild_id = optional_int(league.get("guild_id")),
+                general_channel_id = optional_int(league.get("general_channel_id")),
+                transactions_channel_id = optional_int(league.get("transactions_channel_id"))
+            ) for league in json.load(f)]
+        check_schemas(leagues)
+        return leagues
+    settings = get_settings() if settings is None else settings
+    return [LeagueConfig(
+        league_id = settings.league_id,
+        general_channel_id = settings.general_channel_id,
+        transactions_channel_id = settings.transactions_channel_id
+    )]
@@ -0,0 +1,149 @@
+import numpy as np
+
+from scoring import PlayerScores
+from sql_tables import Roster
+
+# Positions that can fill each flex slot, any other slot only takes its own position
+FLEX_SLOTS = {
+    "FLEX": {"RB", "WR", "TE"},
+    "SUPER_FLEX": {"QB", "RB", "WR", "TE"},
+    "REC_FLEX": {"WR", "TE"},
+    "WRRB_FLEX": {"WR", "RB"},
+    "IDP_FLEX": {"DL", "LB", "DB"},
+}
+# roster_positions entries that aren't starting slots
+RESERVE_SLOTS = {"BN", "IR", "TAXI"}
+# Cost of putting a player in a slot they can't play, worse than leaving the slot empty
+INELIGIBLE = 1e6
+# What a lineup is optimized for: the projected final (what's scored plus what's left) or what's actually been scored
+MEASURES = ["projected", "actual"]
+# Projected points a lineup has to be leaving on the bench before a rendered roster points it out
+BENCH_NOTICE = 1.0
+
+# league_id -> measure -> roster_id -> lineup, from the newest snapshot that was optimized
+_latest_lineups: dict[str | None, dict[str, dict[int, "Lineup"]]] = {}
+
+
+class Lineup:
+    """
+    The best lineup a roster could have started, one player_id (or None for an empty slot) per
+    starting slot, next to what the lineup it actually started scores by the same measure
+    """
+    def __init__(self, roster_id: int, manager_id: int, slots: list[str], starters: list[str | None], points: float, started_points: float):
+        self.roster_id = roster_id
+        self.manager_id = manager_id
+        self.slots = slots
+        self.starters = starters
+        self.points = points
+        self.started_points = started_points
+
+    @property
+    def points_left(self) -> float:
+        """
+        Points left on the bench, how much better the optimal lineup does than the one that was started
+        """
+        return self.points - self.started_points
+
+    def __repr__(self):
+        return f"Roster {self.roster_id}: {self.points:.1f} optimal, {self.started_points:.1f} started, {self.points_left:.1f} left on the bench"
+
+
+def starting_slots(roster_positions: list[str]) -> list[str]:
+    return [slot for slot in roster_positions if slot not in RESERVE_SLOTS]
+
+
+def eligible(slot: str, positions: list[str]) -> bool:
+    return len(FLEX_SLOTS.get(slot, {slot}).intersection(positions)) > 0
+
+
+def assign(cost: np.ndarray) -> np.ndarray:
+    """
+    Hungarian algorithm (the shortest augmenting path version with row and column potentials):
+    the column for each row that minimizes the total cost, for a (rows x columns) matrix with
+    rows <= columns. O(rows^2 * columns), each step's scan over the columns is one numpy operation.
+    """
+    rows, columns = cost.shape
+    # 1 based with column 0 as the root of each search, as in the textbook version
+    u = np.zeros(rows + 1)
+    v = np.zeros(columns + 1)
+    # owner[j] is the row column j is assigned to, 0 for none
+    owner = np.zeros(columns + 1, dtype=np.intp)
+    way = np.zeros(columns + 1, dtype=np.intp)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        j0 = 0
+        min_reduced = np.full(columns + 1, np.inf)
+        used = np.zeros(columns + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            visited = np.flatnonzero(used)
+            u[owner[visited]] += delta
+            v[visited] -= delta
+            min_reduced[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        # Flip the assignments along the augmenting path
+        while j0 != 0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    assignment = np.full(rows, -1, dtype=np.intp)
+    for column in range(1, columns + 1):
+        if owner[column] != 0:
+            assignment[owner[column] - 1] = column - 1
+    return assignment
+
+
+def optimal_lineup(slots: list[str], player_ids: list[str], positions: dict[str, list[str]], points: np.ndarray) -> tuple[list[str | None], float]:
+    """
+    Fill slots from player_ids (points[i] is what player_ids[i] scores) for the most points. One
+    empty column per slot is added, so a slot nobody eligible can fill (or only for negative points) is left empty.
+    """
+    eligibility = np.array([[eligible(slot, positions.get(player_id, [])) for player_id in player_ids] for slot in slots], dtype=bool).reshape(len(slots), len(player_ids))
+    cost = np.where(eligibility, -points[None, :], INELIGIBLE)
+    cost = np.hstack([cost, np.zeros((len(slots), len(slots)))])
+    assignment = assign(cost)
+    starters = [player_ids[column] if column < len(player_ids) else None for column in assignment]
+    total = float(sum(points[column] for column in assignment if column < len(player_ids)))
+    return starters, total
+
+
+def optimize_rosters(scores: PlayerScores, rosters: list[Roster], roster_positions: list[str], positions: dict[str, list[str]], measure: str = "projected") -> dict[int, Lineup]:
+    """
+    Optimal lineups for every roster in the league, keyed by roster_id. positions maps a
+    player_id to the positions they're eligible at (the player's fantasy_positions).
+    """
+    values = scores.live_projected if measure == "projected" else scores.current
+    slots = starting_slots(roster_positions)
+    lineups = {}
+    for roster in rosters:
+        # Players on IR can't be started
+        reserve = set(roster.reserve or [])
+        player_ids = [p for p in dict.fromkeys((roster.players or []) + (roster.starters or [])) if p in scores.positions and p not in reserve]
+        points = values[[scores.positions[p] for p in player_ids]] if len(player_ids) > 0 else np.zeros(0)
+        starters, total = optimal_lineup(slots, player_ids, positions, points)
+        started = float(sum(values[scores.positions[p]] for p in (roster.starters or []) if p in scores.positions))
+        lineups[roster.roster_id] = Lineup(roster.roster_id, roster.manager_id, slots, starters, total, started)
+    return lineups
+
+
+def set_latest_lineups(league_id: str | None, measure: str, lineups: dict[int, Lineup]) -> None:
+    _latest_lineups.setdefault(league_id, {})[measure] = lineups
+
+
+def latest_lineups(league_id: str | None, measure: str = "projected") -> dict[int, Lineup]:
+    """
+    The lineups from the last refresh tick, for rendering without optimizing again
+    """
+    return _latest_lineups.get(league_id, {}).get(measure, {})
@@ -1,19 +1,51 @@
+import asyncio
 from typing import Final
-import os
-from dotenv import load_dotenv
-from discord import Intents, Client, Message
+from discord import Intents, Client, Message, NotFound
 from discord.ext import tasks
+from http_client import AsyncHttpClient
+from league_cache import get_league_cache
+from metrics import get_metrics
+from polling import PollingScheduler
+from outbound import OutboundQueue, PRIORITY_ALERT, PRIORITY_NORMAL, PRIORITY_ROUTINE
+from render_cache import RenderCache
+from worker_pool import BlockingPool
 from responses import ResponseHandler
+from leagues import LeagueConfig, load_leagues
+from sleeper import get_projected_scores, get_transactions_by_week_async, get_week_async
+from settings import get_settings, install_reload_handler
+from snapshot import build_snapshots_async, warm_start
 
-load_dotenv()
-TOKEN: Final[str] = os.getenv("DISCORD_TOKEN")
-DISCORD_GENERAL_ID = int(os.getenv("DISCORD_GENERAL_ID"))
-DISCORD_TRANSACTIONS_ID = int(os.getenv("DISCORD_TRANSACTIONS_ID"))
-RIGOR = os.getenv("RIGOR")
+settings = get_settings()
+TOKEN: Final[str] = settings.discord_token
 intents: Intents = Intents.default()
 intents.message_content = True  # NOQA
 client = Client(intents=intents)
-response_handler = ResponseHandler()
+# One handler (and database schema) per league, all sharing the http client, caches and loops below
+leagues: list[LeagueConfig] = load_leagues()
+response_handlers: dict[str, ResponseHandler] = {league.league_id: ResponseHandler(league) for league in leagues}
+http_client = AsyncHttpClient()
+render_cache = RenderCache()
+outbound = OutboundQueue()
+pool = BlockingPool()
+metrics = get_metrics()
+scheduler = PollingScheduler()
+polling_mode = None
+COMMAND_TIMEOUT = 30.0
+COMPACTION_TIMEOUT = 600.0
+
+def handler_for(message: Message) -> ResponseHandler:
+    """
+    The league a chat command is about: the one whose channel it was sent in, else the one for
+    that server, else the first league
+    """
+    for league in leagues:
+        if message.channel.id in league.channel_ids():
+            return response_handlers[league.league_id]
+    guild_id = message.guild.id if message.guild is not None else None
+    for league in leagues:
+        if guild_id is not None and league.guild_id == guild_id:
+            return response_handlers[league.league_id]
+    return response_handlers[leagues[0].league_id]
 
 async def send_message(message: Message, user_message: str) -> None:
     if not user_message:
@@ -23,69 +55,187 @@ async def send_message(message: Message, user_message: str) -> None:
     if is_private := user_message[0] == "?":
         user_message = user_message[1:]
 
+    response_handler = handler_for(message)
+    if response_handler.is_admin_command(user_message) and message.author.id not in get_settings().admin_ids:
+        return
+
     try:
-        response: str = response_handler.handle(user_message)
+        response: str = await pool.run("command", response_handler.handle, user_message, timeout=COMMAND_TIMEOUT)
         if response is not None:
-            await message.author.send(response) if is_private else await message.channel.send(response)
+            outbound.send(message.author if is_private else message.channel, response, priority=PRIORITY_NORMAL)
     except Exception as e:
-        print(e)
+        metrics.error("command", e)
+
+def reschedule() -> None:
+    """
+    Point the loops at the polling intervals the game calendar calls for right now
+    """
+    global polling_mode
+    roster_interval = scheduler.roster_interval()
+    update_rosters.change_interval(seconds=roster_interval)
+    update_projected_scores.change_interval(seconds=roster_interval)
+    update_transactions.change_interval(seconds=scheduler.transaction_interval())
+    if scheduler.mode() != polling_mode:
+        polling_mode = scheduler.mode()
+        print(f"Polling mode: {polling_mode}, rosters every {roster_interval:.0f}s, transactions every {scheduler.transaction_interval():.0f}s")
+
+def score_and_refresh_rosters(response_handler: ResponseHandler, snapshot):
+    manager_scores = [get_projected_scores(roster, snapshot) for roster in snapshot.rosters]
+    return response_handler.refresh_rosters(snapshot, manager_scores)
 
 @tasks.loop(minutes=3.0)
 async def update_rosters() -> None:
     try:
-        response: str = response_handler.handle("!rosters")
-        if response is not None:
-            channel = client.get_channel(DISCORD_GENERAL_ID)
-            await channel.send(response)
+        with metrics.tick("update_rosters"):
+            # One fetch of the shared data (projections, scoreboard, stats) for every league
+            with metrics.span("snapshot_seconds"):
+                snapshots = await build_snapshots_async(http_client, [league.league_id for league in leagues])
+            for league in leagues:
+                snapshot = snapshots[league.league_id]
+                scheduler.observe_scoreboard(snapshot.scoreboard)
+                try:
+                    response: str = await pool.run("update_rosters", score_and_refresh_rosters, response_handlers[league.league_id], snapshot)
+                    if response is not None:
+                        # Late swap alerts
+                        outbound.send(client.get_channel(league.general_channel_id), response, priority=PRIORITY_ALERT)
+                except Exception as e:
+                    metrics.error(f"update_rosters {league.name}", e)
     except Exception as e:
-        print(e)
+        metrics.error("update_rosters", e)
+    finally:
+        reschedule()
+
+async def update_league_transactions(league: LeagueConfig, week: int) -> None:
+    response_handler = response_handlers[league.league_id]
+    weeks = await pool.run("transaction_weeks", response_handler.transaction_weeks, week)
+    weekly_transactions = await asyncio.gather(*[
+        get_transactions_by_week_async(http_client, week=_week, league_id=league.league_id) for _week in weeks
+    ])
+    all_transactions = [transaction for transactions in weekly_transactions for transaction in transactions]
+    response: str = await pool.run("update_transactions", response_handler.refresh_transactions, all_transactions, week)
+    if response is not None:
+        outbound.send(client.get_channel(league.transactions_channel_id), response, priority=PRIORITY_NORMAL)
 
 @tasks.loop(minutes=3.0)
 async def update_transactions() -> None:
     try:
-        response: str = response_handler.handle("!transactions")
-        if response is not None:
-            channel = client.get_channel(DISCORD_TRANSACTIONS_ID)
-            await channel.send(response)
+        with metrics.tick("update_transactions"):
+            week = await get_week_async(http_client)
+            results = await asyncio.gather(*[update_league_transactions(league, week) for league in leagues], return_exceptions=True)
+            for league, result in zip(leagues, results):
+                if isinstance(result, Exception):
+                    metrics.error(f"update_transactions {league.name}", result)
     except Exception as e:
-        print(e)
+        metrics.error("update_transactions", e)
+    finally:
+        update_transactions.change_interval(seconds=scheduler.transaction_interval())
 
-@tasks.loop(minutes=3.0)
-async def update_projected_scores() -> None:
-    # try:
+def roster_message_ids(manager) -> tuple[int, int | None]:
+    if get_settings().is_dev:
+        return manager.dev_transaction_channel_id, manager.dev_transaction_message_id
+    return manager.transaction_channel_id, manager.transaction_message_id
+
+def set_roster_message_id(response_handler: ResponseHandler, manager, message_id: int | None) -> None:
+    if get_settings().is_dev:
+        manager.dev_transaction_message_id = message_id
+    else:
+        manager.transaction_message_id = message_id
+    response_handler.db.db_session.commit()
+
+def render_rosters(response_handler: ResponseHandler) -> list[tuple]:
+    """
+    Everything update_projected_scores needs from the database, as (manager, channel id, message id, text)
+    """
     live_roster_results = response_handler.db.get_managers_and_rosters()
+    response_handler.db.prefetch_rostered_players()
+    rendered = []
     for manager, roster in live_roster_results:
-        message_id = None
-        if RIGOR == "DEV":
-            channel = client.get_channel(manager.dev_transaction_channel_id)
-            message_id = manager.dev_transaction_message_id
-        else:
-            channel = client.get_channel(manager.transaction_channel_id)
-            message_id = manager.transaction_message_id
-        response = response_handler.db.display_roster(roster)
-
-        if message_id is None:
-            message = await channel.send(response)
-            if RIGOR == "DEV":
-                manager.dev_transaction_message_id = message.id
-            else:
-                manager.transaction_message_id = message.id
-            response_handler.db.db_session.commit()
-        else:
-            message = await channel.fetch_message(message_id) 
-            await message.edit(content=response)
-
-
-    #except Exception as e:
-    #    print(e)
+        channel_id, message_id = roster_message_ids(manager)
+        rendered.append((manager, channel_id, message_id, response_handler.db.display_roster(roster, manager)))
+    return rendered
+
+@tasks.loop(minutes=3.0)
+async def update_projected_scores() -> None:
+    try:
+        with metrics.tick("update_projected_scores"):
+            render_cache.start_tick()
+            for league in leagues:
+                response_handler = response_handlers[league.league_id]
+                rendered = await pool.run("render_rosters", render_rosters, response_handler, lock=response_handler.db.lock)
+                await post_rosters(response_handler, rendered)
+    except Exception as e:
+        metrics.error("update_projected_scores", e)
 
+async def post_rosters(response_handler: ResponseHandler, rendered: list[tuple]) -> None:
+    for manager, channel_id, message_id, response in rendered:
+        channel = client.get_channel(channel_id)
+        if message_id is not None:
+            if not render_cache.should_edit(message_id, response):
+                continue
+            render_cache.store(message_id, response)
+            edit = outbound.edit(channel, message_id, response, priority=PRIORITY_ROUTINE)
+            edit.add_done_callback(lambda future, manager=manager, message_id=message_id: roster_edit_done(future, response_handler, manager, message_id))
+            continue
+
+        message = (await outbound.send(channel, response, priority=PRIORITY_ROUTINE))[0]
+        render_cache.store(message.id, response)
+        await pool.run("set_roster_message", set_roster_message_id, response_handler, manager, message.id, lock=response_handler.db.lock)
+
+def roster_edit_done(future: asyncio.Future, response_handler: ResponseHandler, manager, message_id: int) -> None:
+    """
+    Edits aren't awaited, so a failed one gets cleaned up here for the next tick to retry
+    """
+    if future.cancelled() or future.exception() is None:
+        return
+    render_cache.forget(message_id)
+    if isinstance(future.exception(), NotFound):
+        # Someone deleted the message, the next tick posts a new one
+        asyncio.ensure_future(pool.run("set_roster_message", set_roster_message_id, response_handler, manager, None, lock=response_handler.db.lock))
+
+@tasks.loop(hours=6.0)
+async def compact_score_history() -> None:
+    for response_handler in response_handlers.values():
+        try:
+            await pool.run("compact_score_history", response_handler.db.compact_score_history, timeout=COMPACTION_TIMEOUT, lock=response_handler.db.lock)
+        except Exception as e:
+            metrics.error("compact_score_history", e)
+
+@tasks.loop(hours=1.0)
+async def report_task_latency() -> None:
+    if len(pool.latency) > 0:
+        print(pool.report())
+
+@tasks.loop(minutes=1.0)
+async def export_metrics() -> None:
+    """
+    Keep the prometheus text file at METRICS_PATH current, when one is set
+    """
+    if get_settings().metrics_path is None:
+        return
+    try:
+        await pool.run("export_metrics", metrics.write_exposition, get_settings().metrics_path)
+    except Exception as e:
+        metrics.error("export_metrics", e)
 
 @client.event
 async def on_ready() -> None:
     print(f"{client.user} is now running!")
+    await pool.run("warm_start", warm_start)
+    # kill -HUP picks up .env changes (e.g. RIGOR) without a restart
+    install_reload_handler(asyncio.get_running_loop())
+    outbound.start()
+    for league in leagues:
+        try:
+            league_info = await get_league_cache().get_async(http_client, league.league_id)
+            scheduler.set_waiver_schedule(league_info.waiver_weekday)
+        except Exception as e:
+            metrics.error(f"league settings {league.name}", e)
     update_rosters.start()
     update_transactions.start()
     update_projected_scores.start()
+    compact_score_history.start()
+    report_task_latency.start()
+    export_metrics.start()
 
 @client.event
 async def on_message(message: Message) -> None:
@@ -0,0 +1,277 @@
+from bisect import bisect_left
+import cProfile
+from contextlib import contextmanager
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from sqlalchemy import Engine, event
+
+# Upper bounds of the latency buckets in seconds, close to prometheus' defaults
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+# Buckets for things that are counted rather than timed, like queries per tick
+COUNT_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+PREFIX = "sleeperbot_"
+PROFILE_DIR = os.path.join("assets", "profiles")
+# The pool tasks that make up a refresh tick, these are what !profile captures
+PROFILED_TASKS = ["update_rosters", "update_transactions", "render_rosters"]
+_NUMBER = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_label(url) -> str:
+    """
+    Host and path with the ids taken out, so every league / week hits the same histogram
+    """
+    parts = urlsplit(str(url))
+    return parts.netloc + _NUMBER.sub("/:id", parts.path)
+
+
+def _label_str(labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _title(name: str, labels: tuple) -> str:
+    return " ".join([name] + [str(value) for _, value in labels])
+
+
+class Histogram:
+    """
+    Observation counts per bucket, enough for percentiles to within a bucket
+    """
+    def __init__(self, buckets: list[float] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count > 0 else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket the q-th observation falls in (never more than the max seen)
+        """
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [self.max], self.counts):
+            seen += count
+            if count > 0 and seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    Process wide histograms and counters, keyed by name and labels. Safe to use from the worker threads.
+    """
+    def __init__(self, profile_dir: str = PROFILE_DIR):
+        self.lock = threading.Lock()
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.started = time.time()
+        self.profile_dir = profile_dir
+        self.profile_pending: set[str] = set()
+
+    def observe(self, name: str, value: float, buckets: list[float] | None = None, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(BUCKETS if buckets is None else buckets)
+            histogram.observe(value)
+
+    def count(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def counter(self, name: str, **labels) -> float:
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """
+        Time the block into the name histogram, e.g. with metrics.span("scoring_seconds"): ...
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def tick(self, loop: str):
+        """
+        Time one run of a discord loop and count the database round trips made during it. The loops
+        can overlap, so a tick's query count may include a few queries from another loop.
+        """
+        queries = self.counter("db_queries")
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("tick_seconds", time.perf_counter() - started, loop=loop)
+            self.observe("tick_db_queries", self.counter("db_queries") - queries, buckets=COUNT_BUCKETS, loop=loop)
+
+    def error(self, where: str, e: Exception) -> None:
+        self.count("errors", where=where, error=type(e).__name__)
+        print(f"{where}: {type(e).__name__}: {e}")
+
+    def arm_profile(self, tasks: list[str] | None = None) -> list[str]:
+        """
+        Profile the next run of each of these pool tasks
+        """
+        tasks = PROFILED_TASKS if tasks is None else tasks
+        with self.lock:
+            self.profile_pending = set(tasks)
+        return tasks
+
+    @contextmanager
+    def maybe_profile(self, name: str):
+        """
+        cProfile the block if a profile of name was asked for, the stats are written to profile_dir
+        for pstats / snakeviz. cProfile only sees the current thread, so this goes inside the worker.
+        """
+        with self.lock:
+            armed = name in self.profile_pending
+            self.profile_pending.discard(name)
+        if not armed:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{name}-{int(time.time())}.prof")
+            profiler.dump_stats(path)
+            print(f"Wrote profile {path}")
+
+    def summary(self) -> str:
+        """
+        Human readable version for !stats
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = [f"Up {(time.time() - self.started) / 3600:.1f}h"]
+        for (name, labels), histogram in histograms:
+            if name.endswith("_seconds"):
+                values = [histogram.quantile(0.5), histogram.quantile(0.95), histogram.max]
+                stats = ", ".join(f"{which} {value * 1000:.1f} ms" for which, value in zip(["p50", "p95", "max"], values))
+            else:
+                stats = f"p50 {histogram.quantile(0.5):.0f}, p95 {histogram.quantile(0.95):.0f}, max {histogram.max:.0f}"
+            lines.append(f"{_title(name, labels)}: {histogram.count}x, {stats}")
+        for (name, labels), value in counters:
+            lines.append(f"{_title(name, labels)}: {value:.0f}")
+        return "\n".join(lines)
+
+    def exposition(self) -> str:
+        """
+        Everything in the prometheus text format
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        typed = set()
+        for (name, labels), histogram in histograms:
+            metric = PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            seen = 0
+            for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                seen += count
+                le = f'le="{bound}"'
+                lines.append(f"{metric}_bucket{_label_str(labels, le)} {seen}")
+            lines.append(f"{metric}_sum{_label_str(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_label_str(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_label_str(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_exposition(self, path: str) -> None:
+        """
+        Write the exposition where node_exporter's textfile collector (or anything else) can pick it up
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.exposition())
+        os.replace(tmp_path, path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def observe_response(response, *args, **kwargs) -> None:
+    """
+    requests response hook. elapsed is the time until the headers arrived, not the whole body.
+    """
+    endpoint = endpoint_label(response.url)
+    _metrics.observe("upstream_seconds", response.elapsed.total_seconds(), endpoint=endpoint)
+    if response.status_code >= 400:
+        _metrics.count("upstream_errors", endpoint=endpoint, status=response.status_code)
+
+
+def upstream_trace_config() -> aiohttp.TraceConfig:
+    """
+    The aiohttp version of observe_response, also timed until the headers arrived
+    """
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        endpoint = endpoint_label(params.url)
+        _metrics.observe("upstream_seconds", time.perf_counter() - context.started, endpoint=endpoint)
+        if params.response.status >= 400:
+            _metrics.count("upstream_errors", endpoint=endpoint, status=params.response.status)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    # A statement that fails never gets to after_cursor_execute, so this is just overwritten next time
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.pop("query_started", time.perf_counter())
+    _metrics.count("db_queries")
+    _metrics.observe("db_query_seconds", time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Count and time every statement sent through engine
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
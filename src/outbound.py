@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import time
+
+from discord import Message
+from discord.abc import Messageable
+
+from metrics import get_metrics
+
+MESSAGE_LIMIT = 2000
+PRIORITY_ALERT = 0
+PRIORITY_NORMAL = 5
+PRIORITY_ROUTINE = 10
+# Discord allows roughly 5 messages per 5 seconds in a channel
+CHANNEL_RATE = 1.0
+CHANNEL_BURST = 5
+
+
+def chunk_message(content: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Split a message into pieces discord will accept, on line breaks where possible. Discord rejects
+    empty messages, so blank content gives no pieces at all.
+    """
+    if content.strip() == "":
+        return []
+    chunks = []
+    current = ""
+    for line in content.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = line if not current else f"{current}\n{line}"
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip() != ""]
+
+
+def truncate_message(content: str, limit: int = MESSAGE_LIMIT) -> str:
+    """
+    An edit can't be split across messages, so cut it off instead
+    """
+    if len(content) <= limit:
+        return content
+    return content[:limit - 4].rsplit("\n", 1)[0] + "\n..."
+
+
+class TokenBucket:
+    def __init__(self, rate: float = CHANNEL_RATE, capacity: int = CHANNEL_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self) -> float:
+        """
+        Seconds until a token is available, 0 if one is available now
+        """
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class _Outbound:
+    """
+    A queued send or edit. A send holds all its chunks and goes out one chunk per token.
+    """
+    def __init__(self, priority: int, order: int, target: Messageable, chunks: list[str], message_id: int | None = None):
+        self.priority = priority
+        self.order = order
+        self.target = target
+        self.chunks = chunks
+        self.message_id = message_id
+        self.sent: list[Message] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(_report_failure)
+
+    @property
+    def key(self) -> int:
+        return self.target.id
+
+
+def _report_failure(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Outbound message failed: {future.exception()!r}")
+
+
+class OutboundQueue:
+    """
+    Every message the bot sends or edits goes through here. Each channel gets a token bucket,
+    alerts go before routine refreshes, repeated edits of a message collapse into the newest
+    one and long messages get split to fit discord's limit.
+    """
+    def __init__(self, rate: float = CHANNEL_RATE, burst: int = CHANNEL_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: dict[int, TokenBucket] = {}
+        self.pending: list[_Outbound] = []
+        self.pending_edits: dict[int, _Outbound] = {}
+        self.counter = itertools.count()
+        self.coalesced = 0
+        self.delivered = 0
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def send(self, target: Messageable, content: str, priority: int = PRIORITY_NORMAL) -> asyncio.Future:
+        """
+        Queue a new message, the future resolves to the list of messages it was split into.
+        Blank content isn't sent at all and resolves to no messages.
+        """
+        chunks = chunk_message(content)
+        if len(chunks) == 0:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result([])
+            return future
+        item = _Outbound(priority, next(self.counter), target, chunks)
+        self._push(item)
+        return item.future
+
+    def edit(self, channel: Messageable, message_id: int, content: str, priority: int = PRIORITY_ROUTINE) -> asyncio.Future:
+        """
+        Queue an edit. If an edit of the same message is still waiting, it just takes the new content.
+        """
+        content = truncate_message(content)
+        item = self.pending_edits.get(message_id)
+        if item is not None:
+            item.chunks = [content]
+            item.priority = min(item.priority, priority)
+            self.pending.sort(key=lambda _o: (_o.priority, _o.order))
+            self.coalesced += 1
+            return item.future
+        item = _Outbound(priority, next(self.counter), channel, [content], message_id=message_id)
+        self.pending_edits[message_id] = item
+        self._push(item)
+        return item.future
+
+    def _push(self, item: _Outbound) -> None:
+        self.pending.append(item)
+        self.pending.sort(key=lambda _o: (_o.priority, _o.order))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _bucket(self, key: int) -> TokenBucket:
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(self.rate, self.burst)
+        return self.buckets[key]
+
+    def _next_ready(self) -> tuple[_Outbound | None, float | None]:
+        """
+        Highest priority item whose channel has a token, otherwise how long until one will
+        """
+        wait = None
+        for item in self.pending:
+            ready_in = self._bucket(item.key).ready_in()
+            if ready_in == 0:
+                return item, None
+            wait = ready_in if wait is None else min(wait, ready_in)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            item, wait = self._next_ready()
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._bucket(item.key).take()
+            await self._deliver(item)
+
+    async def _deliver(self, item: _Outbound) -> None:
+        is_edit = item.message_id is not None
+        if is_edit:
+            # Anything coalesced from here on needs a new edit
+            self.pending_edits.pop(item.message_id, None)
+        action = "edit" if is_edit else "send"
+        try:
+            chunk = item.chunks.pop(0)
+            with get_metrics().span("discord_seconds", action=action):
+                if is_edit:
+                    message = await item.target.get_partial_message(item.message_id).edit(content=chunk)
+                else:
+                    message = await item.target.send(chunk)
+            item.sent.append(message)
+            self.delivered += 1
+        except Exception as e:
+            get_metrics().count("discord_errors", action=action, error=type(e).__name__)
+            self.pending.remove(item)
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if len(item.chunks) == 0:
+            self.pending.remove(item)
+            if not item.future.done():
+                item.future.set_result(item.sent)
+
+    def __repr__(self):
+        return f"OutboundQueue: {len(self.pending)} pending, {self.delivered} delivered, {self.coalesced} edits coalesced"
@@ -0,0 +1,161 @@
+import math
+from typing import Callable
+
+import numpy as np
+
+from metrics import get_metrics
+from sleeper import get_matchup_pairs
+from sql_tables import Roster
+from timeseries import ScoreSeries, weekly_finals
+
+SEASONS = 100000
+# Seasons simulated per array operation, keeps memory flat however many seasons are asked for
+BATCH = 10000
+SEED = 2025
+# Sleeper's defaults, used when the league settings don't say
+PLAYOFF_WEEK_START = 15
+PLAYOFF_TEAMS = 6
+# League wide weekly score until there's history to learn it from
+DEFAULT_MEAN = 110.0
+DEFAULT_SD = 25.0
+# A manager's own weeks are weighed against this many weeks of the league average
+SHRINKAGE_WEEKS = 3
+
+# (league_id, week) -> that week's (roster_id, roster_id) pairs. The regular season schedule doesn't change.
+_schedules: dict[tuple[str, int], list[tuple[int, int]]] = {}
+# league_id -> (what the odds were computed from, odds)
+_results: dict[str, tuple[tuple, dict[int, "PlayoffOdds"]]] = {}
+
+
+class PlayoffOdds:
+    """
+    How one roster's season ends up over the simulations
+    """
+    def __init__(self, roster_id: int, manager_id: int, playoffs: float, bye: float, mean_wins: float, mean_seed: float):
+        self.roster_id = roster_id
+        self.manager_id = manager_id
+        self.playoffs = playoffs
+        self.bye = bye
+        self.mean_wins = mean_wins
+        self.mean_seed = mean_seed
+
+    def __repr__(self):
+        return f"Roster {self.roster_id}: {self.playoffs:.0%} playoffs, {self.bye:.0%} bye, {self.mean_wins:.1f} wins, seed {self.mean_seed:.1f}"
+
+
+def playoff_byes(playoff_teams: int) -> int:
+    """
+    Teams that skip the first round, whatever's needed to fill out a power of two bracket
+    """
+    if playoff_teams < 2:
+        return 0
+    return 2 ** math.ceil(math.log2(playoff_teams)) - playoff_teams
+
+
+def scoring_distributions(rosters: list[Roster], series: dict[int, ScoreSeries], now: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Weekly score (mean, sd) per roster. The mean comes from points_for, which covers the whole season,
+    the spread from the finished weeks in the ManagerScore history. Both are shrunk toward the league
+    so a manager with two good weeks isn't treated as a sure thing.
+    """
+    finals = [weekly_finals(series[roster.manager_id], now) if roster.manager_id in series else np.zeros(0) for roster in rosters]
+    pooled = np.concatenate(finals) if len(finals) > 0 else np.zeros(0)
+    league_var = pooled.var() if len(pooled) > 1 else DEFAULT_SD ** 2
+
+    games = np.array([(roster.wins or 0) + (roster.losses or 0) + (roster.ties or 0) for roster in rosters], dtype=np.float64)
+    points_for = np.array([roster.points_for or 0 for roster in rosters], dtype=np.float64)
+    own_mean = np.divide(points_for, games, out=np.zeros(len(rosters)), where=games > 0)
+    league_mean = points_for.sum() / games.sum() if games.sum() > 0 else (pooled.mean() if len(pooled) > 0 else DEFAULT_MEAN)
+    mean = (games * own_mean + SHRINKAGE_WEEKS * league_mean) / (games + SHRINKAGE_WEEKS)
+
+    weeks = np.array([len(f) for f in finals], dtype=np.float64)
+    own_var = np.array([f.var() if len(f) > 1 else 0.0 for f in finals])
+    var = (weeks * own_var + SHRINKAGE_WEEKS * league_var) / (weeks + SHRINKAGE_WEEKS)
+    return mean, np.sqrt(var)
+
+
+def simulate_seasons(wins: np.ndarray, points_for: np.ndarray, mean: np.ndarray, sd: np.ndarray, schedule: list[np.ndarray], playoff_teams: int, byes: int, seasons: int = SEASONS, seed: int | None = SEED, batch: int = BATCH) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Play out the remaining schedule (a (matchups x 2) array of roster indices per week) seasons times.
+    Seeding goes by wins, then points for. Returns per roster (playoff chance, bye chance, mean wins, mean seed).
+    """
+    rng = np.random.default_rng(seed)
+    num_rosters = len(wins)
+    made = np.zeros(num_rosters)
+    got_bye = np.zeros(num_rosters)
+    total_wins = np.zeros(num_rosters)
+    total_seed = np.zeros(num_rosters)
+    places = np.arange(num_rosters)
+    played = []
+    for pairs in schedule:
+        week_played = np.zeros(num_rosters, dtype=bool)
+        week_played[pairs.ravel()] = True
+        played.append(week_played)
+
+    done = 0
+    while done < seasons:
+        n = min(batch, seasons - done)
+        season_wins = np.tile(wins.astype(np.float64), (n, 1))
+        season_points = np.tile(points_for.astype(np.float64), (n, 1))
+        for pairs, week_played in zip(schedule, played):
+            scores = mean + sd * rng.standard_normal((n, num_rosters))
+            home_won = scores[:, pairs[:, 0]] > scores[:, pairs[:, 1]]
+            season_wins[:, pairs[:, 0]] += home_won
+            season_wins[:, pairs[:, 1]] += ~home_won
+            season_points += scores * week_played
+        # Points for only matters between teams with the same record, and never adds up to 1e5
+        ranking = np.argsort(-(season_wins * 1e5 + season_points), axis=1)
+        seeds = np.empty_like(ranking)
+        np.put_along_axis(seeds, ranking, np.broadcast_to(places, ranking.shape), axis=1)
+        made += (seeds < playoff_teams).sum(axis=0)
+        got_bye += (seeds < byes).sum(axis=0)
+        total_wins += season_wins.sum(axis=0)
+        total_seed += seeds.sum(axis=0) + n
+        done += n
+    return made / seasons, got_bye / seasons, total_wins / seasons, total_seed / seasons
+
+
+def remaining_schedule(league_id: str, weeks: list[int]) -> dict[int, list[tuple[int, int]]]:
+    for week in weeks:
+        if (league_id, week) not in _schedules:
+            _schedules[(league_id, week)] = get_matchup_pairs(week, league_id)
+    return {week: _schedules[(league_id, week)] for week in weeks}
+
+
+def get_playoff_odds(league_id: str, rosters: list[Roster], load_series: Callable[[list[int]], dict[int, ScoreSeries]], league_settings: dict, seasons: int = SEASONS) -> dict[int, PlayoffOdds]:
+    """
+    Playoff odds for every roster, keyed by roster_id. They only change when a week's results
+    land in the standings, so they're kept until the standings (or settings) change. load_series
+    gets the managers' score history, it's only called when the odds need computing.
+    """
+    playoff_week_start = int(league_settings.get("playoff_week_start") or PLAYOFF_WEEK_START)
+    playoff_teams = int(league_settings.get("playoff_teams") or PLAYOFF_TEAMS)
+    start_week = int(league_settings.get("start_week") or 1)
+    rosters = sorted(rosters, key=lambda _r: _r.roster_id)
+    standings = tuple((r.roster_id, r.wins, r.losses, r.ties, round(r.points_for or 0, 2)) for r in rosters)
+    key = (playoff_week_start, playoff_teams, standings, seasons)
+    cached = _results.get(league_id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    # Weeks already in the standings, rather than sleeper's current week, so a finished week that
+    # hasn't been processed yet is still simulated instead of counted twice or skipped
+    completed = max(((r.wins or 0) + (r.losses or 0) + (r.ties or 0) for r in rosters), default=0)
+    weeks = list(range(start_week + completed, playoff_week_start))
+    roster_index = {roster.roster_id: i for i, roster in enumerate(rosters)}
+    schedule = [
+        np.array([(roster_index[home], roster_index[away]) for home, away in pairs if home in roster_index and away in roster_index], dtype=np.intp).reshape(-1, 2)
+        for pairs in remaining_schedule(league_id, weeks).values()
+    ]
+
+    wins = np.array([(r.wins or 0) + 0.5 * (r.ties or 0) for r in rosters])
+    points_for = np.array([r.points_for or 0 for r in rosters], dtype=np.float64)
+    mean, sd = scoring_distributions(rosters, load_series([roster.manager_id for roster in rosters]))
+    with get_metrics().span("playoffs_seconds"):
+        playoffs, byes, mean_wins, mean_seed = simulate_seasons(wins, points_for, mean, sd, schedule, playoff_teams, playoff_byes(playoff_teams), seasons)
+    odds = {
+        roster.roster_id: PlayoffOdds(roster.roster_id, roster.manager_id, float(playoffs[i]), float(byes[i]), float(mean_wins[i]), float(mean_seed[i]))
+        for i, roster in enumerate(rosters)
+    }
+    _results[league_id] = (key, odds)
+    return odds
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta, timezone
+import time
+
+from espn import GAME_LENGTH
+
+# Seconds between polls in each mode
+LIVE_INTERVAL = 45
+GAME_DAY_INTERVAL = 5 * 60
+IDLE_INTERVAL = 60 * 60
+DEFAULT_INTERVAL = 3 * 60
+WAIVER_BURST_INTERVAL = 60
+TRANSACTION_INTERVAL = 15 * 60
+# Start polling live this long before a kickoff, so late swaps get caught
+PREGAME_WINDOW = 20 * 60
+# "Game day" is anything within this long of a kickoff
+GAME_DAY_WINDOW = 6 * 3600
+# Keep polling transactions quickly for this long after waivers run
+WAIVER_BURST = 30 * 60
+# Sleeper runs waivers early in the morning US time, 08:00 UTC is just after midnight Pacific
+WAIVER_HOUR_UTC = 8
+
+
+class PollingScheduler:
+    """
+    Decides how often the discord loops poll upstream, from what the last scoreboard said
+    about kickoffs and live games and from the league's waiver day. Until a scoreboard has
+    been seen it sticks to the old fixed 3 minutes. With several leagues, waivers are watched
+    for each league's waiver day.
+    """
+    def __init__(self, waiver_weekday: int = 2, waiver_hour: int = WAIVER_HOUR_UTC):
+        self.kickoffs: list[float] = []
+        self.live = False
+        self.seen_scoreboard = False
+        # Python weekdays, 0 is Monday
+        self.waiver_weekdays = {waiver_weekday}
+        self.waiver_hour = waiver_hour
+        self._default_waivers = True
+
+    def observe_scoreboard(self, scoreboard: dict[str, dict]) -> None:
+        self.kickoffs = sorted(set(game["timestamp"] for game in scoreboard.values()))
+        self.live = any(game.get("live", False) for game in scoreboard.values())
+        self.seen_scoreboard = True
+
+    def set_waiver_schedule(self, weekday: int, hour: int = WAIVER_HOUR_UTC) -> None:
+        """
+        Add a league's waiver day, replacing the default the first time
+        """
+        if self._default_waivers:
+            self.waiver_weekdays = set()
+            self._default_waivers = False
+        self.waiver_weekdays.add(weekday)
+        self.waiver_hour = hour
+
+    def _next_kickoff(self, now: float) -> float | None:
+        for kickoff in self.kickoffs:
+            if kickoff > now:
+                return kickoff
+        return None
+
+    def is_live(self, now: float | None = None) -> bool:
+        """
+        A game is on, or one is about to start. Kickoffs are checked too in case the scoreboard is stale.
+        """
+        now = time.time() if now is None else now
+        if self.live:
+            return True
+        for kickoff in self.kickoffs:
+            if kickoff - PREGAME_WINDOW <= now <= kickoff + GAME_LENGTH:
+                return True
+        return False
+
+    def is_game_day(self, now: float) -> bool:
+        return any(abs(kickoff - now) <= GAME_DAY_WINDOW for kickoff in self.kickoffs)
+
+    def roster_interval(self, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        if not self.seen_scoreboard:
+            return DEFAULT_INTERVAL
+        if self.is_live(now):
+            return LIVE_INTERVAL
+        interval = GAME_DAY_INTERVAL if self.is_game_day(now) else IDLE_INTERVAL
+        # Don't sleep through the start of the next pregame window
+        next_kickoff = self._next_kickoff(now)
+        if next_kickoff is not None:
+            interval = min(interval, next_kickoff - PREGAME_WINDOW - now)
+        return max(interval, LIVE_INTERVAL)
+
+    def _last_run(self, now: float, weekday: int) -> float:
+        today = datetime.fromtimestamp(now, tz=timezone.utc).replace(hour=self.waiver_hour, minute=0, second=0, microsecond=0)
+        run = today - timedelta(days=(today.weekday() - weekday) % 7)
+        if run.timestamp() > now:
+            run -= timedelta(days=7)
+        return run.timestamp()
+
+    def last_waiver_run(self, now: float) -> float:
+        return max(self._last_run(now, weekday) for weekday in self.waiver_weekdays)
+
+    def next_waiver_run(self, now: float) -> float:
+        return min(self._last_run(now, weekday) for weekday in self.waiver_weekdays) + 7 * 24 * 3600
+
+    def transaction_interval(self, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        last_run = self.last_waiver_run(now)
+        if now - last_run < WAIVER_BURST:
+            return WAIVER_BURST_INTERVAL
+        if not self.seen_scoreboard or self.is_game_day(now):
+            # Free agent pickups right before kickoff
+            return DEFAULT_INTERVAL
+        next_run = self.next_waiver_run(now)
+        return max(min(TRANSACTION_INTERVAL, next_run - now), WAIVER_BURST_INTERVAL)
+
+    def mode(self, now: float | None = None) -> str:
+        now = time.time() if now is None else now
+        if not self.seen_scoreboard:
+            return "default"
+        if self.is_live(now):
+            return "live"
+        return "game day" if self.is_game_day(now) else "idle"
@@ -0,0 +1,46 @@
+import hashlib
+
+from metrics import get_metrics
+
+
+class RenderCache:
+    """
+    Hash of the content last sent to each discord message, so a message only gets edited
+    when what it would show actually changed
+    """
+    def __init__(self):
+        self.hashes: dict[int, bytes] = {}
+        self.edited = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _hash(content: str) -> bytes:
+        return hashlib.md5(content.encode("utf-8")).digest()
+
+    def is_current(self, message_id: int, content: str) -> bool:
+        return self.hashes.get(message_id) == self._hash(content)
+
+    def store(self, message_id: int, content: str) -> None:
+        self.hashes[message_id] = self._hash(content)
+
+    def forget(self, message_id: int) -> None:
+        self.hashes.pop(message_id, None)
+
+    def start_tick(self) -> None:
+        self.edited = 0
+        self.skipped = 0
+
+    def should_edit(self, message_id: int, content: str) -> bool:
+        """
+        Check a message before editing it, counting it as skipped when it's already up to date
+        """
+        if self.is_current(message_id, content):
+            self.skipped += 1
+            get_metrics().count("roster_edits_skipped")
+            return False
+        self.edited += 1
+        get_metrics().count("roster_edits")
+        return True
+
+    def __repr__(self):
+        return f"RenderCache: {len(self.hashes)} messages, {self.edited} edited / {self.skipped} skipped last tick"
@@ -0,0 +1,404 @@
+from contextlib import contextmanager
+import gzip
+import hashlib
+from http import HTTPStatus
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import curl_extractor
+import http_cache
+from http_client import AsyncHttpClient, get_session
+
+FIXTURE_VERSION = 1
+MANIFEST = "manifest.json"
+HEADERS_FILE = "headers.txt"
+# The only response headers the bot looks at: the content type and the disk cache's validators
+KEPT_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+# GraphQL request headers that are safe to keep in a fixture, everything else is auth
+SAFE_REQUEST_HEADERS = ["accept", "content-type", "origin", "referer", "user-agent"]
+
+
+def _body_hash(body: bytes | str) -> str:
+    if isinstance(body, str):
+        body = body.encode()
+    try:
+        # requests and aiohttp serialize the same payload slightly differently
+        body = json.dumps(json.loads(body), sort_keys=True).encode()
+    except ValueError:
+        pass
+    return hashlib.sha1(body).hexdigest()
+
+
+def request_key(method: str, url: str, params: dict | None = None, body: bytes | str | None = None) -> str:
+    """
+    What identifies a request in the fixtures: method, url with its query sorted, and a hash of
+    the body for the GraphQL POSTs. Request headers don't count.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(name, str(value)) for name, value in params.items()]
+    url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+    key = f"{method.upper()} {url}"
+    if body:
+        key += f" {_body_hash(body)}"
+    return key
+
+
+class Fixtures:
+    """
+    A recorded stretch of a game day: every response, gzipped, with the tick it was fetched in and
+    when it arrived relative to the start of the recording. manifest.json indexes them, see record()
+    for how to make one.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded_at = int(time.time())
+        self.league_ids: list[str] = []
+        self.interval = 0
+        self.ticks = 0
+        self.entries: list[dict] = []
+        self._by_key: dict[str, list[dict]] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "Fixtures":
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FIXTURE_VERSION:
+            raise ValueError(f"{path} is fixture version {manifest.get('version')}, expected {FIXTURE_VERSION}")
+        fixtures = cls(path)
+        fixtures.recorded_at = manifest["recorded_at"]
+        fixtures.league_ids = manifest["league_ids"]
+        fixtures.interval = manifest["interval"]
+        fixtures.ticks = manifest["ticks"]
+        for entry in manifest["entries"]:
+            fixtures._index(entry)
+        return fixtures
+
+    def _index(self, entry: dict) -> None:
+        self.entries.append(entry)
+        self._by_key.setdefault(entry["key"], []).append(entry)
+
+    def has(self, key: str) -> bool:
+        return key in self._by_key
+
+    def add(self, key: str, url: str, status: int, headers, body: bytes, offset: float) -> dict:
+        os.makedirs(self.path, exist_ok=True)
+        file_name = f"{len(self.entries):05d}.gz"
+        with gzip.open(os.path.join(self.path, file_name), "wb", compresslevel=6) as f:
+            f.write(body)
+        entry = {
+            "key": key,
+            "url": url,
+            "status": status,
+            "headers": {name: headers[name] for name in KEPT_HEADERS if name in headers},
+            "tick": self.ticks,
+            "offset": round(offset, 3),
+            "file": file_name
+        }
+        self._index(entry)
+        return entry
+
+    def save(self) -> None:
+        manifest = {
+            "version": FIXTURE_VERSION,
+            "recorded_at": self.recorded_at,
+            "league_ids": self.league_ids,
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "entries": self.entries
+        }
+        tmp_path = os.path.join(self.path, MANIFEST + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+    def tick_at(self, offset: float) -> int:
+        # Fetches land a little after each tick starts, so go by tick rather than exact offsets
+        if self.interval <= 0:
+            return 0
+        return int(offset // self.interval)
+
+    def lookup(self, key: str, offset: float) -> dict:
+        """
+        The newest response recorded in or before the tick at offset, or the first one if there's none that early
+        """
+        entries = self._by_key.get(key)
+        if not entries:
+            raise LookupError(f"Nothing recorded for {key}")
+        tick = self.tick_at(offset)
+        match = entries[0]
+        for entry in entries:
+            if entry["tick"] > tick:
+                break
+            match = entry
+        return match
+
+    def read_body(self, entry: dict) -> bytes:
+        with gzip.open(os.path.join(self.path, entry["file"]), "rb") as f:
+            return f.read()
+
+    def respond(self, key: str, offset: float, request_headers=None) -> tuple[int, dict, bytes]:
+        entry = self.lookup(key, offset)
+        headers = dict(entry["headers"])
+        etag = headers.get("ETag")
+        if etag is not None and request_headers is not None and request_headers.get("If-None-Match") == etag:
+            return 304, headers, b""
+        return entry["status"], headers, self.read_body(entry)
+
+    def __repr__(self):
+        return f"Fixtures {self.path}: {len(self.entries)} responses over {self.ticks} ticks, recorded at {self.recorded_at}"
+
+
+class SimulatedClock:
+    """
+    Stands in for time.time while replaying, so freshness checks, polling and the stored timestamps
+    all see the recorded day instead of today. It only moves when advanced.
+    """
+    def __init__(self, start: float):
+        self.start = start
+        self.now = start
+        self._real_time = None
+
+    def time(self) -> float:
+        return self.now
+
+    def offset(self) -> float:
+        return self.now - self.start
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+    def __enter__(self) -> "SimulatedClock":
+        self._real_time = time.time
+        time.time = self.time
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        time.time = self._real_time
+
+
+def _mount(session: requests.Session, adapter: HTTPAdapter) -> None:
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Passes requests through as usual and saves every response into the fixtures
+    """
+    def __init__(self, fixtures: Fixtures, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 304:
+            # Replay answers conditional requests itself from the last full response
+            return response
+        # Reading the body here leaves it in place for the caller, streamed or not
+        body = response.content
+        key = request_key(request.method, request.url, body=request.body)
+        self.fixtures.add(key, request.url, response.status_code, response.headers, body, time.time() - self.fixtures.recorded_at)
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Answers the shared requests session from the fixtures, as of the simulated clock. Nothing
+    goes over the network, a request that was never recorded raises LookupError.
+    """
+    def __init__(self, fixtures: Fixtures, clock: SimulatedClock):
+        super().__init__()
+        self.fixtures = fixtures
+        self.clock = clock
+        self.requests = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.requests += 1
+        key = request_key(request.method, request.url, body=request.body)
+        status, headers, body = self.fixtures.respond(key, self.clock.offset(), request.headers)
+        response = requests.Response()
+        response.status_code = status
+        response.reason = HTTPStatus(status).phrase
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+class _ReplayResponse:
+    """
+    Just the parts of an aiohttp response the bot uses
+    """
+    def __init__(self, url: str, status: int, headers: dict, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    async def __aenter__(self) -> "_ReplayResponse":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise aiohttp.ClientError(f"{self.status} for {self.url}")
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def json(self, content_type: str | None = None):
+        return json.loads(self.body)
+
+
+class _ReplaySession:
+    def __init__(self, client: "ReplayAsyncClient"):
+        self.client = client
+
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None) -> _ReplayResponse:
+        return self.client.respond("GET", url, params, headers)
+
+    def post(self, url: str, headers: dict | None = None, data: str | None = None, **kwargs) -> _ReplayResponse:
+        body = data if kwargs.get("json") is None else json.dumps(kwargs["json"])
+        return self.client.respond("POST", url, None, headers, body)
+
+    @property
+    def closed(self) -> bool:
+        return False
+
+
+class ReplayAsyncClient(AsyncHttpClient):
+    """
+    AsyncHttpClient answered from the fixtures instead of aiohttp
+    """
+    def __init__(self, fixtures: Fixtures, clock: SimulatedClock):
+        super().__init__()
+        self.fixtures = fixtures
+        self.clock = clock
+        self.requests = 0
+
+    def session(self) -> _ReplaySession:
+        return _ReplaySession(self)
+
+    def respond(self, method: str, url: str, params: dict | None = None, headers: dict | None = None, body: str | None = None) -> _ReplayResponse:
+        self.requests += 1
+        status, response_headers, response_body = self.fixtures.respond(request_key(method, url, params, body), self.clock.offset(), headers)
+        return _ReplayResponse(url, status, response_headers, response_body)
+
+
+@contextmanager
+def scratch_cache():
+    """
+    Point the on-disk http cache at a temporary directory, so recording and replaying
+    neither read nor overwrite assets/cache
+    """
+    previous = http_cache.CACHE_DIR
+    with tempfile.TemporaryDirectory() as cache_dir:
+        http_cache.CACHE_DIR = cache_dir
+        try:
+            yield cache_dir
+        finally:
+            http_cache.CACHE_DIR = previous
+
+
+@contextmanager
+def replaying(fixtures: Fixtures, session: requests.Session | None = None):
+    """
+    Everything needed to run the bot's code against fixtures: the simulated clock (starting where
+    the recording did), a scratch disk cache, the fixture's GraphQL headers and the replay adapter.
+    Yields (clock, adapter, async client).
+    """
+    session = get_session() if session is None else session
+    previous_adapters = dict(session.adapters)
+    previous_headers = curl_extractor.HEADERS_PATH
+    clock = SimulatedClock(fixtures.recorded_at)
+    adapter = ReplayAdapter(fixtures, clock)
+    _mount(session, adapter)
+    curl_extractor.HEADERS_PATH = os.path.join(fixtures.path, HEADERS_FILE)
+    try:
+        with clock, scratch_cache():
+            yield clock, adapter, ReplayAsyncClient(fixtures, clock)
+    finally:
+        session.adapters.clear()
+        session.adapters.update(previous_adapters)
+        curl_extractor.HEADERS_PATH = previous_headers
+
+
+def write_headers(path: str) -> None:
+    """
+    Copy the GraphQL curl headers without anything secret, replay doesn't look at them anyway
+    """
+    url, headers = curl_extractor.extract_curl_data()
+    with open(os.path.join(path, HEADERS_FILE), "w") as f:
+        f.write(f"curl '{url}' \\\n")
+        for name, value in headers.items():
+            if name.lower() in SAFE_REQUEST_HEADERS:
+                f.write(f"  -H '{name}: {value}' \\\n")
+
+
+def record(path: str, league_ids: list[str], ticks: int = 20, interval: float = 180, players: bool = True) -> Fixtures:
+    """
+    Record a fixture by running the bot's fetches every interval seconds, ticks times: the week,
+    league and users, everything a snapshot fetches, both weeks of transactions and the ESPN
+    kickoffs. Everything is fetched fresh each tick, the full player dump (big) once at the start.
+    """
+    from espn import get_game_windows
+    from league_cache import get_league_cache
+    from sleeper import PLAYERS_URL, SEASON, get_transactions_by_week, get_week
+    from snapshot import build_snapshots, invalidate
+
+    os.makedirs(path, exist_ok=True)
+    fixtures = Fixtures(path)
+    fixtures.league_ids = league_ids
+    fixtures.interval = interval
+    write_headers(path)
+    _mount(get_session(), RecordingAdapter(fixtures))
+    with scratch_cache():
+        if players:
+            for _ in http_cache.open_cached(PLAYERS_URL, "players", 0)[1]:
+                pass
+        for tick in range(ticks):
+            started = time.time()
+            invalidate()
+            for league_id in league_ids:
+                get_league_cache().get(league_id)
+            week = get_week()
+            build_snapshots(league_ids)
+            for league_id in league_ids:
+                for _week in [week - 1, week]:
+                    get_transactions_by_week(week=_week, league_id=league_id)
+            get_game_windows(week, SEASON)
+            fixtures.ticks += 1
+            fixtures.save()
+            print(f"Tick {tick + 1}/{ticks}: {len(fixtures.entries)} responses recorded")
+            if tick < ticks - 1:
+                time.sleep(max(0.0, interval - (time.time() - started)))
+    return fixtures
+
+
+if __name__ == "__main__":
+    # python replay.py record <fixture dir> [ticks] [interval seconds], for every configured league
+    from leagues import load_leagues
+    if len(sys.argv) < 3 or sys.argv[1] != "record":
+        print("usage: python replay.py record <fixture dir> [ticks] [interval seconds]")
+        sys.exit(1)
+    ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    interval = float(sys.argv[4]) if len(sys.argv) > 4 else 180
+    print(record(sys.argv[2], [league.league_id for league in load_leagues()], ticks, interval))
@@ -1,13 +1,29 @@
 from random import choice, randint
+import time
 
 from db_helper import DatabaseHelper
-from sql_tables import Manager, Roster
-from sleeper import get_rosters, get_transactions_by_week, get_week, get_projected_scores
+from league_cache import get_league_cache
+from lineup import MEASURES
+from metrics import get_metrics
+from playoffs import get_playoff_odds
+from sql_tables import Manager, ManagerScore, Roster, Transaction
+from timeseries import ScoreSeries
+from leagues import LeagueConfig
+from sleeper import get_league_id, get_transactions_by_week, get_week, get_projected_scores, rostered_player_ids
+from snapshot import RefreshSnapshot, build_snapshot
+
+# Only the users in settings.admin_ids get answers to these
+ADMIN_COMMANDS = ["stats", "profile"]
+# How far back !playoffs looks for weekly scores, a whole regular season
+SCORE_HISTORY = 20 * 7 * 24 * 3600
 
 
 class ResponseHandler:
-    def __init__(self):
-        self.db = DatabaseHelper()
+    def __init__(self, league: LeagueConfig | None = None):
+        if league is None:
+            league = LeagueConfig(get_league_id())
+        self.league = league
+        self.db = DatabaseHelper(league.league_id, league.db_schema)
         self.managers = {m.display_name.lower(): m for m in self.db.get_all_managers()}
 
     def handle(self, message: str) -> str:
@@ -17,6 +33,10 @@ class ResponseHandler:
         else:
             return self.handle_basic_response(lowered)
     
+    def is_admin_command(self, message: str) -> bool:
+        lowered = message.lower()
+        return lowered[:1] == "!" and lowered.split("!")[-1].split(" -")[0] in ADMIN_COMMANDS
+
     def handle_unknown_response(self):
         #return choice(["I do not understand", "What?", "Repeat that?", "Come again?"])
         return
@@ -37,17 +57,20 @@ class ResponseHandler:
             return self.handle_unknown_response()
     
     def process_command(self, player_input: str) -> str:
+        # Fetching and simulating happen outside the league's lock, only the session reads and
+        # writes (self.db.locked()) wait on a refresh that's running
         # Extract everything up to first " -"
         command = player_input.split(" -")[0]
         # Extract all arguments separated with " -"
         command_args = player_input.split(" -")[1:]
         if command in self.managers.keys():
-            q = self.db.db_session.query(Manager)
-            q = q.where(Manager.display_name.ilike(command))
-            q = q.join(Roster, Roster.manager_id == Manager.manager_id)
-            q = q.add_columns(Roster)
-            manager, roster = q.first()
-            players = self.db.get_players_by_ids(roster.starters)
+            with self.db.locked():
+                q = self.db.db_session.query(Manager)
+                q = q.where(Manager.display_name.ilike(command))
+                q = q.join(Roster, Roster.manager_id == Manager.manager_id)
+                q = q.add_columns(Roster)
+                manager, roster = q.first()
+                players = self.db.get_players_by_ids(roster.starters)
 
             starter_str = ""
             for starter in roster.starters:
@@ -61,41 +84,168 @@ class ResponseHandler:
                 teams_str += team + "\n"
             return teams_str
         elif player_input == "rosters":
-            live_rosters = get_rosters()
-            for roster in live_rosters:
-                projections = get_projected_scores(roster = roster)
-                self.db.db_session.add(projections)
-            self.db.db_session.commit()
-            return self.db.update_rosters(live_rosters, True)
+            snapshot = build_snapshot(league_id=self.league.league_id)
+            manager_scores = [get_projected_scores(roster = roster, snapshot = snapshot) for roster in snapshot.rosters]
+            return self.refresh_rosters(snapshot, manager_scores)
         elif player_input == "transactions":
-            all_transactions = get_transactions_by_week(week=get_week())
-            all_transactions += get_transactions_by_week(week=get_week()-1)
-            db_transactions = self.db.get_transactions_by_week(week=get_week())
-            db_transactions += self.db.get_transactions_by_week(week=get_week()-1)
-            all_transaction_ids = set([int(_t.transaction_id) for _t in all_transactions])
-            db_transaction_ids = set([int(_t.transaction_id) for _t in db_transactions])
-            new_transactions = all_transaction_ids.difference(db_transaction_ids)
-            transaction_str = None
-            for transaction in all_transactions:
-                if int(transaction.transaction_id) in new_transactions and transaction.status == "complete":
-                    if transaction_str is None:
-                        transaction_str = f"{self.db.display_transaction(transaction)}\n"
-                    else:
-                        transaction_str += f"{self.db.display_transaction(transaction)}\n"
-                if int(transaction.transaction_id) in new_transactions:
-                    print(new_transactions)
-                    print()
-                    print(db_transactions)
-                    print()
-                    print(all_transactions)
-                    self.db.db_session.add(transaction)
-                    self.db.db_session.commit()  # TODO: Problably want to move a bit of this logic
-            return transaction_str
+            week = get_week()
+            all_transactions = []
+            for _week in self.transaction_weeks(week):
+                all_transactions += get_transactions_by_week(week=_week, league_id=self.league.league_id)
+            return self.refresh_transactions(all_transactions, week)
+        elif player_input == "odds":
+            return self.display_odds(build_snapshot(league_id=self.league.league_id))
+        elif player_input == "playoffs":
+            return self.display_playoffs()
+        elif command == "optimal":
+            if len(command_args) == 0 or command_args[0].strip() not in self.managers.keys():
+                return f"Usage: !optimal -<manager>, one of {', '.join(self.managers.keys())}"
+            return self.display_optimal(build_snapshot(league_id=self.league.league_id), self.managers[command_args[0].strip()])
+        elif player_input == "bench":
+            return self.display_bench(build_snapshot(league_id=self.league.league_id))
+        elif player_input == "refreshleague":
+            league = get_league_cache().get(self.league.league_id, force=True)
+            return f"Reloaded league settings for {league.league.get('name', league.league_id)}"
+        elif player_input == "stats":
+            return get_metrics().summary()
+        elif player_input == "profile":
+            tasks = get_metrics().arm_profile()
+            return f"Profiling the next {', '.join(tasks)} into {get_metrics().profile_dir}"
         elif player_input == "currentidiot":
             return "the current idiot is trevbawt :("
         else:
             return self.handle_unknown_response()
 
+    def refresh_rosters(self, snapshot: RefreshSnapshot, manager_scores: list[ManagerScore]) -> str | None:
+        """
+        Store freshly fetched manager scores and the snapshot's rosters. The fetching is left to
+        the caller so the discord tasks can do it with the async client.
+        """
+        # Simulated and optimized here so the rendered rosters can show this tick's odds and
+        # lineups, outside the lock since neither needs the session
+        snapshot.matchup_odds
+        with self.db.locked():
+            for manager_score in manager_scores:
+                self.db.db_session.add(manager_score)
+            self.db.db_session.commit()
+            positions = self.player_positions(snapshot)
+        for measure in MEASURES:
+            snapshot.optimal_lineups(positions, measure)
+        with self.db.locked():
+            return self.db.update_rosters(commit=True, snapshot=snapshot)
+
+    def display_odds(self, snapshot: RefreshSnapshot) -> str:
+        odds = snapshot.matchup_odds
+        if len(odds) == 0:
+            return "No matchups this week"
+        odds_str = ""
+        for home_id, away_id in snapshot.matchups:
+            if home_id not in odds:
+                continue
+            home, away = odds[home_id], odds[away_id]
+            with self.db.locked():
+                home_manager = self.db.get_manager(home.manager_id)
+                away_manager = self.db.get_manager(away.manager_id)
+            odds_str += f"**{home_manager.team_name}** {home.win_probability:.0%} ({home.median:.1f}) vs **{away_manager.team_name}** {away.win_probability:.0%} ({away.median:.1f})\n"
+        return odds_str
+
+    def display_playoffs(self) -> str:
+        league = get_league_cache().get(self.league.league_id)
+        with self.db.locked():
+            rosters = {roster.roster_id: roster for roster in self.db.get_rosters()}
+
+        def load_series(manager_ids: list[int]) -> dict[int, ScoreSeries]:
+            with self.db.locked():
+                return self.db.get_score_series(start=int(time.time()) - SCORE_HISTORY, manager_ids=manager_ids)
+
+        # The seasons are simulated without the lock
+        odds = get_playoff_odds(self.league.league_id, list(rosters.values()), load_series, league.settings)
+        playoffs_str = ""
+        for place, roster_odds in enumerate(sorted(odds.values(), key=lambda _o: (-_o.playoffs, -_o.bye, _o.mean_seed)), start=1):
+            roster = rosters[roster_odds.roster_id]
+            with self.db.locked():
+                manager = self.db.get_manager(roster_odds.manager_id)
+            playoffs_str += f"{place}. **{manager.team_name}** ({roster.wins}-{roster.losses}): {roster_odds.playoffs:.0%} playoffs, {roster_odds.bye:.0%} bye, {roster_odds.mean_wins:.1f} wins on average\n"
+        return playoffs_str
+
+    def player_positions(self, snapshot: RefreshSnapshot) -> dict[str, list[str]]:
+        """
+        player_id -> positions they can be started at, for every rostered player
+        """
+        with self.db.locked():
+            players = self.db.get_players_by_ids(rostered_player_ids(snapshot.rosters))
+        return {player.player_id: player.fantasy_positions or [player.position] for player in players}
+
+    def display_optimal(self, snapshot: RefreshSnapshot, manager: Manager) -> str:
+        roster = next((roster for roster in snapshot.rosters if roster.manager_id == manager.manager_id), None)
+        if roster is None:
+            return f"No roster for {manager.display_name}"
+        positions = self.player_positions(snapshot)
+        lineup = snapshot.optimal_lineups(positions, "projected")[roster.roster_id]
+        actual = snapshot.optimal_lineups(positions, "actual")[roster.roster_id]
+        scores = snapshot.player_scores
+        started = set(roster.starters or [])
+
+        sit = [player_id for player_id in roster.starters or [] if player_id in scores.positions and player_id not in lineup.starters]
+        with self.db.locked():
+            players = {player.player_id: player for player in self.db.get_players_by_ids([p for p in lineup.starters + sit if p is not None])}
+
+        optimal_str = f"## **{manager.team_name}** optimal lineup ({lineup.points:.2f} projected, started {lineup.started_points:.2f})\n"
+        for slot, player_id in zip(lineup.slots, lineup.starters):
+            if player_id is None:
+                optimal_str += f"{slot}: Empty\n"
+                continue
+            swap = "" if player_id in started else " (bench)"
+            optimal_str += f"{slot}: {players.get(player_id)} {scores.live_projected[scores.positions[player_id]]:.2f}{swap}\n"
+        if len(sit) > 0:
+            optimal_str += f"Sit: {', '.join(str(players.get(player_id)) for player_id in sit)}\n"
+        optimal_str += f"{actual.points_left:.2f} points left on the bench so far this week\n"
+        return optimal_str
+
+    def display_bench(self, snapshot: RefreshSnapshot) -> str:
+        """
+        This week's points left on the bench, optimal lineup by what's been scored minus what was
+        started. The season total is sleeper's potential points minus points for.
+        """
+        lineups = snapshot.optimal_lineups(self.player_positions(snapshot), "actual")
+        if len(lineups) == 0:
+            return "No lineups this week"
+        rosters = {roster.roster_id: roster for roster in snapshot.rosters}
+        bench_str = f"## Points left on the bench, week {snapshot.week}\n"
+        for place, lineup in enumerate(sorted(lineups.values(), key=lambda _l: -_l.points_left), start=1):
+            roster = rosters[lineup.roster_id]
+            with self.db.locked():
+                manager = self.db.get_manager(lineup.manager_id)
+            season = (roster.potential_points or 0) - (roster.points_for or 0)
+            bench_str += f"{place}. **{manager.team_name}** {lineup.points_left:.2f} ({lineup.points:.2f} possible, {lineup.started_points:.2f} started), {season:.2f} this season\n"
+        return bench_str
+
+    def transaction_weeks(self, week: int) -> list[int]:
+        """
+        Weeks that need fetching to catch up. Normally just the current one, last week too
+        the first time we see a new week so its late changes (e.g. waivers) aren't missed.
+        """
+        with self.db.locked():
+            watermark = self.db.get_watermark(self.league.league_id, "transactions")
+        if watermark.week is None or watermark.week < week:
+            return [week - 1, week]
+        return [week]
+
+    def refresh_transactions(self, all_transactions: list[Transaction], week: int) -> str | None:
+        """
+        Ingest fetched transactions, returns the display string for the ones that just completed.
+        """
+        with self.db.locked():
+            completed = self.db.ingest_transactions(all_transactions, self.league.league_id, week)
+            if len(completed) == 0:
+                return None
+            completed = sorted(completed, key=lambda _t: (_t.status_updated or 0, _t.sequence or 0))
+            self.db.prefetch_transactions(completed)
+            transaction_str = ""
+            for transaction in completed:
+                transaction_str += f"{self.db.display_transaction(transaction)}\n"
+            return transaction_str
+
 if __name__ == "__main__":
     response_handler = ResponseHandler()
     print(get_week())
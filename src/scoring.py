@@ -0,0 +1,131 @@
+import numpy as np
+
+# Categories that Sleeper doesn't always report but leagues score. When a stat row is
+# missing one of these, it is derived from the attempts/makes columns instead.
+DERIVED_CATEGORIES: dict[str, tuple[str, str]] = {
+    "fgmiss": ("fga", "fgm"),
+    "xpmiss": ("xpa", "xpm"),
+}
+NUMERIC_TYPES = {int, float}
+
+
+class CompiledScoring:
+    """
+    A league's scoring_settings compiled into a weight vector over a fixed category index,
+    so a matrix of player stats can be scored with one matrix-vector product.
+    """
+    def __init__(self, scoring_settings: dict[str, float]):
+        categories = set()
+        for category, weight in scoring_settings.items():
+            if isinstance(weight, (int, float)) and not isinstance(weight, bool):
+                categories.add(category)
+        for derived, (attempts, makes) in DERIVED_CATEGORIES.items():
+            if derived in categories:
+                categories.update([attempts, makes])
+
+        self.categories: list[str] = sorted(categories)
+        self.index: dict[str, int] = {category: i for i, category in enumerate(self.categories)}
+        self.category_set = frozenset(self.categories)
+        self.weights = np.array([float(scoring_settings.get(category, 0)) for category in self.categories], dtype=np.float64)
+        self.derived = [
+            (self.index[derived], self.index[attempts], self.index[makes])
+            for derived, (attempts, makes) in DERIVED_CATEGORIES.items()
+            if derived in self.index
+        ]
+
+    def pack(self, stat_rows: list[dict | None]) -> np.ndarray:
+        """
+        Pack stat dicts into a dense (players x categories) matrix. Rows that are None
+        (bye weeks, no stats yet) stay zero, and categories the league doesn't score are skipped.
+        """
+        num_categories = len(self.categories)
+        flat_index, values = [], []
+        reported = {derived: [] for derived, _, _ in self.derived}
+        index = self.index
+        category_set = self.category_set
+        for row_num, stats in enumerate(stat_rows):
+            if not stats:
+                continue
+            offset = row_num * num_categories
+            # Set intersection runs in C, so categories the league doesn't score cost nothing
+            for category in category_set.intersection(stats):
+                value = stats[category]
+                if value.__class__ in NUMERIC_TYPES:
+                    flat_index.append(offset + index[category])
+                    values.append(value)
+            for derived, _, _ in self.derived:
+                if self.categories[derived] in stats:
+                    reported[derived].append(row_num)
+        matrix = np.zeros(len(stat_rows) * num_categories, dtype=np.float64)
+        matrix[flat_index] = values
+        matrix = matrix.reshape(len(stat_rows), num_categories)
+
+        for derived, attempts, makes in self.derived:
+            missing = np.ones(len(stat_rows), dtype=bool)
+            missing[reported[derived]] = False
+            matrix[missing, derived] = np.maximum(matrix[missing, attempts] - matrix[missing, makes], 0)
+        return matrix
+
+    def score(self, stat_rows: list[dict | None]) -> np.ndarray:
+        return self.pack(stat_rows) @ self.weights
+
+
+class PlayerScores:
+    """
+    Projected, current and live-interpolated fantasy points for every rostered player in the league.
+    """
+    def __init__(self, player_ids: list[str], projected: np.ndarray, current: np.ndarray, live_projected: np.ndarray, has_projection: np.ndarray, remaining: np.ndarray | None = None):
+        self.player_ids = player_ids
+        self.positions = {player_id: i for i, player_id in enumerate(player_ids)}
+        self.projected = projected
+        self.current = current
+        self.live_projected = live_projected
+        self.has_projection = has_projection
+        # Share of each player's game still to be played, 1 before kickoff and 0 once it's over (or on a bye)
+        self.remaining = has_projection.astype(np.float64) if remaining is None else remaining
+
+    def totals(self, player_ids: list[str]) -> tuple[float, float]:
+        """
+        Sum (current, projected) points for a set of players, e.g. a roster's starters
+        """
+        idx = np.array([self.positions[p] for p in player_ids if p in self.positions], dtype=np.intp)
+        if len(idx) == 0:
+            return 0.0, 0.0
+        current = float(self.current[idx].sum())
+        projected = float(self.live_projected[idx][self.has_projection[idx]].sum())
+        return current, projected
+
+
+def score_players(compiled: CompiledScoring, player_ids: list[str], projections: dict[str, dict], player_stats: dict[str, dict], scoreboard: dict, projected: np.ndarray | None = None) -> PlayerScores:
+    """
+    Score every player passed in at once. While a player's game is in progress their projection
+    is scaled by the share of the game left and added onto what they have already scored.
+    Projections change far less often than live stats, so already computed projected scores
+    for the same player_ids can be passed back in to skip packing them again.
+    """
+    projection_rows = []
+    stat_rows = []
+    in_game = np.zeros(len(player_ids), dtype=bool)
+    minutes_left = np.zeros(len(player_ids), dtype=np.float64)
+    has_projection = np.zeros(len(player_ids), dtype=bool)
+    for i, player_id in enumerate(player_ids):
+        projection = projections.get(player_id)
+        stats = player_stats.get(player_id)
+        if projected is None:
+            projection_rows.append(projection["stats"] if projection else None)
+        stat_rows.append(stats["stats"] if stats else None)
+        if projection is None:
+            # Means the player is on a bye
+            continue
+        has_projection[i] = True
+        matchup = scoreboard.get(projection.get("team"), {})
+        if matchup.get("in_progress", False):
+            in_game[i] = True
+            minutes_left[i] = matchup["time_remaining"]
+
+    if projected is None:
+        projected = compiled.score(projection_rows)
+    current = compiled.score(stat_rows)
+    live_projected = np.where(in_game, projected * minutes_left / 60 + current, projected)
+    remaining = np.where(in_game, np.clip(minutes_left / 60, 0, 1), has_projection.astype(np.float64))
+    return PlayerScores(player_ids, projected, current, live_projected, has_projection, remaining)
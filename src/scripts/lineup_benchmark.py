@@ -0,0 +1,65 @@
+import itertools
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from lineup import optimal_lineup, optimize_rosters, starting_slots
+from scripts.simulation_benchmark import fake_league
+
+TARGET_MS = 50
+ROSTER_POSITIONS = ["QB", "RB", "RB", "WR", "WR", "TE", "FLEX", "SUPER_FLEX", "K", "DEF"] + ["BN"] * 6
+POSITIONS = ["QB", "RB", "RB", "WR", "WR", "WR", "TE", "K", "DEF"]
+
+
+def brute_force(slots: list[str], player_ids: list[str], positions: dict[str, list[str]], points: np.ndarray) -> float:
+    """
+    Every way of filling the slots, only feasible for a handful of players
+    """
+    best = 0.0
+    padded = player_ids + [None] * len(slots)
+    for picks in itertools.permutations(range(len(padded)), len(slots)):
+        total = 0.0
+        for slot, pick in zip(slots, picks):
+            if pick >= len(player_ids):
+                continue
+            if not any(position in positions[player_ids[pick]] for position in ({"RB", "WR", "TE"} if slot == "FLEX" else {slot})):
+                break
+            total += points[pick]
+        else:
+            best = max(best, total)
+    return best
+
+
+def check(trials: int = 200, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    slots = ["QB", "RB", "WR", "FLEX"]
+    for _ in range(trials):
+        player_ids = [str(i) for i in range(6)]
+        positions = {p: [str(rng.choice(["QB", "RB", "WR", "TE"]))] for p in player_ids}
+        points = rng.uniform(-2, 25, len(player_ids))
+        _, total = optimal_lineup(slots, player_ids, positions, points)
+        assert abs(total - brute_force(slots, player_ids, positions, points)) < 1e-9
+
+
+def main():
+    # python scripts/lineup_benchmark.py [rosters]
+    num_rosters = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    check()
+    scores, rosters, _ = fake_league(num_rosters=num_rosters, num_starters=len(starting_slots(ROSTER_POSITIONS)))
+    rng = np.random.default_rng(1)
+    positions = {player_id: [str(rng.choice(POSITIONS))] for player_id in scores.player_ids}
+    timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        lineups = optimize_rosters(scores, rosters, ROSTER_POSITIONS, positions)
+        timings.append((time.perf_counter() - start) * 1000)
+    median = statistics.median(timings)
+    print(f"{num_rosters} rosters: median {median:.1f} ms, max {max(timings):.1f} ms (target < {TARGET_MS} ms)")
+    for lineup in lineups.values():
+        print(f"  {lineup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sleeper import iter_all_players
+from sql_tables import player_row
+
+CHUNK_SIZE = 64 * 1024
+
+
+def fake_dump(path: str, num_players: int = 11000) -> None:
+    """
+    Write something shaped like the /players/nfl dump, ~40 attributes per player
+    """
+    players = {}
+    for i in range(num_players):
+        player_id = str(i)
+        players[player_id] = {
+            "player_id": player_id,
+            "full_name": f"Player {i}",
+            "first_name": "Player",
+            "last_name": str(i),
+            "fantasy_positions": [random.choice(["QB", "RB", "WR", "TE", "K", "DEF"])],
+            "position": "WR",
+            "team": random.choice(["BUF", "MIA", "KC", None]),
+            "status": "Active",
+            "number": random.randint(1, 99),
+            "height": "72",
+            "weight": str(random.randint(170, 330)),
+            "years_exp": random.randint(0, 15),
+            "depth_chart_order": None,
+            "injury_status": None,
+            "news_updated": 1700000000000 + i,
+            "college": "Somewhere State",
+            "birth_date": "1999-01-01",
+            "search_rank": i,
+            "metadata": {"channel_id": str(random.getrandbits(64)), "rookie_year": "2021"},
+            **{f"{source}_id": random.getrandbits(32) for source in ["espn", "yahoo", "sportradar", "gsis", "rotowire", "rotoworld", "fantasy_data", "stats", "swish", "pandascore", "oddsjam", "opta"]},
+            **{f"unused_{n}": None for n in range(12)},
+        }
+    with open(path, "w") as f:
+        json.dump(players, f)
+
+
+def read_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def full_parse(path: str) -> int:
+    """
+    What get_all_players did: hold the whole body, build the full dict tree, copy it to a second dict
+    """
+    with open(path, "rb") as f:
+        body = f.read()
+    player_dict = json.loads(body)
+    players = {}
+    for player_id, player in player_dict.items():
+        players[str(player_id)] = player
+    rows = [player_row(player) for player in players.values()]
+    return len(rows)
+
+
+def streamed_parse(path: str) -> int:
+    count = 0
+    for _, attributes in iter_all_players(read_chunks(path)):
+        player_row(attributes)
+        count += 1
+    return count
+
+
+def measure(func, path: str) -> tuple[int, float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func(path)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, seconds, peak / 1024 / 1024
+
+
+def main():
+    if len(sys.argv) > 1:
+        # A real dump saved with `curl https://api.sleeper.app/v1/players/nfl > players.json`
+        path = sys.argv[1]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "players.json")
+        fake_dump(path)
+    print(f"Dump size: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    for name, func in [("json.loads + copy", full_parse), ("streaming", streamed_parse)]:
+        count, seconds, peak_mb = measure(func, path)
+        print(f"  {name:<18} {count} players in {seconds:.2f}s, peak traced memory {peak_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
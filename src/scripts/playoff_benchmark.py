@@ -0,0 +1,35 @@
+import sys
+import time
+
+import numpy as np
+
+from playoffs import playoff_byes, simulate_seasons
+
+
+def fake_season(num_rosters: int = 12, weeks_played: int = 7, weeks_left: int = 7, seed: int = 0):
+    """
+    Standings part way through a season, and a random schedule for the rest of it
+    """
+    rng = np.random.default_rng(seed)
+    wins = rng.integers(0, weeks_played + 1, num_rosters).astype(np.float64)
+    mean = rng.uniform(95, 130, num_rosters)
+    sd = rng.uniform(18, 30, num_rosters)
+    points_for = mean * weeks_played + rng.normal(0, 40, num_rosters)
+    schedule = [rng.permutation(num_rosters).reshape(-1, 2) for _ in range(weeks_left)]
+    return wins, points_for, mean, sd, schedule
+
+
+def main():
+    # python scripts/playoff_benchmark.py [seasons]
+    seasons = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    wins, points_for, mean, sd, schedule = fake_season()
+    start = time.perf_counter()
+    playoffs, byes, mean_wins, mean_seed = simulate_seasons(wins, points_for, mean, sd, schedule, 6, playoff_byes(6), seasons)
+    seconds = time.perf_counter() - start
+    print(f"{seasons} seasons, {len(schedule)} weeks left for {len(wins)} rosters: {seconds:.2f}s")
+    for i in np.argsort(-playoffs):
+        print(f"  roster {i + 1}: {wins[i]:.0f} wins, {mean[i]:.0f} a week -> {playoffs[i]:.1%} playoffs, {byes[i]:.1%} bye, {mean_wins[i]:.1f} wins, seed {mean_seed[i]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
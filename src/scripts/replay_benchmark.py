@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import sqlalchemy as sql
+
+from league_cache import get_league_cache
+from leagues import LeagueConfig
+from metrics import get_metrics
+from replay import Fixtures, replaying, request_key
+from responses import ResponseHandler
+from sleeper import PLAYERS_URL, get_rosters, get_transactions_by_week, get_week, rostered_player_ids, update_players
+from snapshot import build_snapshots_async
+from sql_tables import Base, player_row
+
+STAGES = ["rosters", "transactions", "render", "snapshot_async"]
+RESULTS_FILE = "last_benchmark.json"
+
+
+def seed(handler: ResponseHandler, fixtures: Fixtures) -> None:
+    """
+    Managers and players have to be there before rosters and transactions can point at them
+    """
+    db = handler.db
+    league_id = handler.league.league_id
+    for manager in get_league_cache().get(league_id).managers():
+        db.db_session.merge(manager)
+    db.db_session.commit()
+    handler.managers = {m.display_name.lower(): m for m in db.get_all_managers()}
+
+    if fixtures.has(request_key("GET", PLAYERS_URL)):
+        update_players([db], force=True)
+        return
+    # Recorded without the player dump, so just enough players for the foreign keys
+    week = get_week()
+    player_ids = set(rostered_player_ids(get_rosters(league_id)))
+    for _week in [week - 1, week]:
+        for transaction in get_transactions_by_week(week=_week, league_id=league_id):
+            player_ids.update(transaction.players_added or [])
+            player_ids.update(transaction.players_dropped or [])
+    refresh_time = int(time.time())
+    db.sync_players(player_row({"player_id": player_id}, refresh_time) for player_id in player_ids)
+
+
+def render(handler: ResponseHandler) -> list[str]:
+    """
+    What update_projected_scores renders each tick, without the discord side
+    """
+    db = handler.db
+    live_roster_results = db.get_managers_and_rosters()
+    db.prefetch_rostered_players()
+    return [db.display_roster(roster, manager) for manager, roster in live_roster_results]
+
+
+def check_scratch_schema(handler: ResponseHandler) -> None:
+    """
+    Refuse to run unless every table the bot uses is in the scratch schema and that's where the
+    engine points, anything else would write the benchmark's rosters and players into the real tables
+    """
+    db_schema = handler.league.db_schema
+    translate_map = handler.db.db_engine.get_execution_options().get("schema_translate_map") or {}
+    if translate_map.get(None) != db_schema:
+        raise RuntimeError(f"The benchmark engine doesn't point at the scratch schema {db_schema}")
+    q = sql.select(sql.column("table_name")).select_from(sql.table("tables", schema="information_schema"))
+    q = q.where(sql.column("table_schema") == db_schema)
+    with handler.db.db_engine.connect() as conn:
+        tables = set(conn.execute(q).scalars().all())
+    missing = [table.name for table in Base.metadata.sorted_tables if table.name not in tables]
+    if len(missing) > 0:
+        raise RuntimeError(f"Tables missing from the scratch schema {db_schema}: {', '.join(missing)}")
+
+
+def drop_schema(handler: ResponseHandler) -> None:
+    handler.db.db_session.close()
+    with handler.db.db_engine.begin() as conn:
+        conn.execute(sql.text(f'DROP SCHEMA IF EXISTS "{handler.league.db_schema}" CASCADE'))
+    handler.db.db_engine.dispose()
+
+
+def run_ticks(handler: ResponseHandler, client, clock, ticks: int, interval: float) -> dict[str, list[float]]:
+    timings = {stage: [] for stage in STAGES}
+    stages = {
+        "rosters": lambda: handler.process_command("rosters"),
+        "transactions": lambda: handler.process_command("transactions"),
+        "render": lambda: render(handler),
+        "snapshot_async": lambda: asyncio.run(build_snapshots_async(client, [handler.league.league_id])),
+    }
+    for tick in range(ticks):
+        if tick > 0:
+            clock.advance(interval)
+        for stage in STAGES:
+            start = time.perf_counter()
+            stages[stage]()
+            timings[stage].append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings: dict[str, list[float]]) -> dict[str, dict[str, float]]:
+    """
+    The first tick inserts every roster and warms the caches, so it's reported on its own
+    """
+    summary = {}
+    for stage, seconds in timings.items():
+        warm = np.array(seconds[1:] if len(seconds) > 1 else seconds) * 1000
+        summary[stage] = {
+            "cold_ms": seconds[0] * 1000,
+            "median_ms": float(np.median(warm)),
+            "p95_ms": float(np.percentile(warm, 95)),
+            "max_ms": float(warm.max()),
+        }
+    total = np.sum([timings[stage][1:] or timings[stage] for stage in STAGES], axis=0) * 1000
+    summary["tick"] = {
+        "cold_ms": sum(timings[stage][0] for stage in STAGES) * 1000,
+        "median_ms": float(np.median(total)),
+        "p95_ms": float(np.percentile(total, 95)),
+        "max_ms": float(total.max()),
+    }
+    return summary
+
+
+def report(summary: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]] | None = None) -> None:
+    print(f"  {'stage':<16}{'cold':>10}{'median':>10}{'p95':>10}{'max':>10}")
+    for stage, stats in summary.items():
+        line = f"  {stage:<16}{stats['cold_ms']:>8.1f}ms{stats['median_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms{stats['max_ms']:>8.1f}ms"
+        if baseline is not None and stage in baseline:
+            change = (stats["median_ms"] / baseline[stage]["median_ms"] - 1) * 100
+            line += f"  {change:+.1f}% median vs baseline"
+        print(line)
+
+
+def main():
+    # python scripts/replay_benchmark.py <fixture dir> [baseline json], from the repo root.
+    # Needs Postgres (.env as usual) but nothing else, every tick runs in a scratch schema that's
+    # dropped at the end. Results go to <fixture dir>/last_benchmark.json, copy that to keep a baseline.
+    if len(sys.argv) < 2:
+        print("usage: python scripts/replay_benchmark.py <fixture dir> [baseline json]")
+        sys.exit(1)
+    fixtures = Fixtures.load(sys.argv[1])
+    baseline = None
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            baseline = json.load(f)
+    print(fixtures)
+
+    league = LeagueConfig(fixtures.league_ids[0], name="benchmark", db_schema=f"bench_{os.getpid()}")
+    with replaying(fixtures) as (clock, adapter, client):
+        handler = ResponseHandler(league)
+        try:
+            check_scratch_schema(handler)
+            seed(handler, fixtures)
+            requests_before = adapter.requests + client.requests
+            queries_before = get_metrics().counter("db_queries")
+            timings = run_ticks(handler, client, clock, fixtures.ticks, fixtures.interval)
+            requests_made = adapter.requests + client.requests - requests_before
+            queries_made = get_metrics().counter("db_queries") - queries_before
+        finally:
+            drop_schema(handler)
+
+    summary = summarize(timings)
+    print(f"{fixtures.ticks} ticks, {requests_made / fixtures.ticks:.1f} replayed requests and {queries_made / fixtures.ticks:.1f} database round trips per tick")
+    report(summary, baseline)
+    with open(os.path.join(fixtures.path, RESULTS_FILE), "w") as f:
+        json.dump(summary, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import random
+import time
+
+from scoring import CompiledScoring, score_players
+
+CATEGORIES = [
+    "pass_yd", "pass_td", "pass_int", "pass_2pt", "rush_yd", "rush_td", "rush_2pt", "rec", "rec_yd", "rec_td",
+    "rec_2pt", "fum_lost", "fgm", "fga", "fgmiss", "fgm_0_19", "fgm_20_29", "fgm_30_39", "fgm_40_49", "fgm_50p",
+    "xpm", "xpa", "xpmiss", "def_td", "sack", "int", "fum_rec", "safe", "ff", "blk_kick", "pts_allow_0",
+    "pts_allow_1_6", "pts_allow_7_13", "pts_allow_14_20", "pts_allow_21_27", "pts_allow_28_34", "pts_allow_35p",
+    "st_td", "st_ff", "st_fum_rec", "bonus_rec_te", "bonus_pass_yd_300", "bonus_rush_yd_100", "bonus_rec_yd_100",
+]
+# Sleeper stat rows carry a lot of keys that never score (ranks, adp, pre-computed points, snaps)
+UNSCORED = [
+    "gp", "gs", "gms_active", "pts_ppr", "pts_half_ppr", "pts_std", "adp_dd_ppr", "adp_ppr", "adp_half_ppr", "adp_std",
+    "pos_rank_ppr", "pos_rank_half_ppr", "pos_rank_std", "rank_ppr", "rank_half_ppr", "rank_std", "off_snp",
+    "tm_off_snp", "tm_def_snp", "tm_st_snp", "pass_att", "pass_cmp", "pass_inc", "rush_att", "rec_tgt", "rec_ypr",
+    "rush_ypa", "pass_ypa", "pass_fd", "rush_fd", "rec_fd", "rec_0_4", "rec_5_9", "rec_10_19", "rec_20_29",
+]
+
+
+def apply_scoring(scoring_settings, stats):
+    """
+    The per-category closure get_projected_scores used before the scoring engine, kept as the reference
+    """
+    _score = 0
+    for category, projection in stats.items():
+        try:
+            _score += scoring_settings.get(category, 0) * projection
+        except TypeError:
+            pass
+    return _score
+
+
+def fake_league(num_rosters: int = 12, roster_size: int = 16, num_starters: int = 9):
+    scoring_settings = {category: round(random.uniform(-2, 6), 2) for category in CATEGORIES}
+    player_ids = [str(1000 + i) for i in range(num_rosters * roster_size)]
+    teams = ["BUF", "MIA", "KC", "DEN"]
+    projections = {}
+    player_stats = {}
+    for player_id in player_ids:
+        stats = {category: random.uniform(0, 30) for category in random.sample(CATEGORIES, 12)}
+        stats.update({category: random.uniform(0, 30) for category in UNSCORED})
+        stats["fgmiss"] = stats.get("fga", 0) - stats.get("fgm", 0)
+        stats["xpmiss"] = stats.get("xpa", 0) - stats.get("xpm", 0)
+        stats["injury_status"] = None
+        projections[player_id] = {"player_id": player_id, "team": random.choice(teams), "stats": stats}
+        player_stats[player_id] = {"player_id": player_id, "stats": dict(stats)}
+    scoreboard = {
+        "BUF": {"in_progress": True, "time_remaining": 35},
+        "MIA": {"in_progress": True, "time_remaining": 35},
+        "KC": {"in_progress": False, "time_remaining": 60},
+        "DEN": {"in_progress": False, "time_remaining": 60},
+    }
+    starters = [player_ids[r * roster_size:r * roster_size + num_starters] for r in range(num_rosters)]
+    return scoring_settings, player_ids, starters, projections, player_stats, scoreboard
+
+
+def closure_tick(scoring_settings, starters, projections, player_stats, scoreboard):
+    """
+    Per roster scoring the way get_projected_scores did it: projected and live stats for every
+    starter, plus the live stats again for anyone whose game is in progress
+    """
+    totals = []
+    for roster_starters in starters:
+        projected_total = 0
+        current_total = 0
+        for player_id in roster_starters:
+            projected = apply_scoring(scoring_settings, projections[player_id]["stats"])
+            matchup = scoreboard[projections[player_id]["team"]]
+            if matchup["in_progress"]:
+                current = apply_scoring(scoring_settings, player_stats[player_id]["stats"])
+                projected = projected * matchup["time_remaining"] / 60 + current
+            projected_total += projected
+            current_total += apply_scoring(scoring_settings, player_stats[player_id]["stats"])
+        totals.append((current_total, projected_total))
+    return totals
+
+
+def engine_tick(scoring_settings, player_ids, starters, projections, player_stats, scoreboard, projected=None):
+    scores = score_players(CompiledScoring(scoring_settings), player_ids, projections, player_stats, scoreboard, projected=projected)
+    return scores, [scores.totals(roster_starters) for roster_starters in starters]
+
+
+def time_it(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations: int = 200):
+    scoring_settings, player_ids, starters, projections, player_stats, scoreboard = fake_league()
+    args = (scoring_settings, starters, projections, player_stats, scoreboard)
+
+    expected = closure_tick(*args)
+    scores, totals = engine_tick(scoring_settings, player_ids, *args[1:])
+    max_diff = max(abs(a - b) for old, new in zip(expected, totals) for a, b in zip(old, new))
+
+    closure_ms = time_it(lambda: closure_tick(*args), iterations)
+    # Same work as the engine: every rostered player, bench included, gets a projected and live score
+    all_players_ms = time_it(lambda: closure_tick(scoring_settings, [player_ids], projections, player_stats, scoreboard), iterations)
+    cold_ms = time_it(lambda: engine_tick(scoring_settings, player_ids, *args[1:]), iterations)
+    # Projections only get refetched every few ticks, so usually their scores are reused
+    warm_ms = time_it(lambda: engine_tick(scoring_settings, player_ids, *args[1:], projected=scores.projected), iterations)
+
+    print(f"{len(starters)} rosters, {len(player_ids)} rostered players, {len(scoring_settings)} scored categories")
+    print(f"  apply_scoring closure (starters only): {closure_ms:.3f} ms / tick")
+    print(f"  apply_scoring closure (all players):  {all_players_ms:.3f} ms / tick")
+    print(f"  engine, all players, cold:            {cold_ms:.3f} ms / tick ({all_players_ms / cold_ms:.1f}x)")
+    print(f"  engine, all players, cached proj:     {warm_ms:.3f} ms / tick ({all_players_ms / warm_ms:.1f}x)")
+    print(f"  max difference:                       {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
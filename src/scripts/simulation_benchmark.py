@@ -0,0 +1,54 @@
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from scoring import PlayerScores
+from simulation import simulate_matchups
+from sql_tables import Roster
+
+TARGET_MS = 100
+
+
+def fake_league(num_rosters: int = 12, roster_size: int = 16, num_starters: int = 9, seed: int = 0):
+    """
+    A league mid Sunday: a third of the players done, a third playing, a third still to kick off
+    """
+    rng = np.random.default_rng(seed)
+    player_ids = [str(1000 + i) for i in range(num_rosters * roster_size)]
+    projected = rng.uniform(2, 25, len(player_ids))
+    remaining = rng.choice([0.0, 0.5, 1.0], len(player_ids))
+    current = projected * (1 - remaining) * rng.uniform(0.3, 1.7, len(player_ids))
+    has_projection = np.ones(len(player_ids), dtype=bool)
+    live_projected = current + projected * remaining
+    scores = PlayerScores(player_ids, projected, current, live_projected, has_projection, remaining)
+    rosters = []
+    for r in range(num_rosters):
+        players = player_ids[r * roster_size:(r + 1) * roster_size]
+        rosters.append(Roster(
+            roster_id=r + 1, manager_id=100 + r, players=players, starters=players[:num_starters], reserve=[],
+            streak=None, wins=0, losses=0, ties=0, points_for=0, points_against=0, potential_points=0,
+            total_moves=0, waiver_budget_used=0, waiver_position=0, refreshed_on=0
+        ))
+    matchups = [(r + 1, r + 2) for r in range(0, num_rosters, 2)]
+    return scores, rosters, matchups
+
+
+def main():
+    # python scripts/simulation_benchmark.py [draws]
+    draws = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    scores, rosters, matchups = fake_league()
+    timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        odds = simulate_matchups(scores, rosters, matchups, draws=draws)
+        timings.append((time.perf_counter() - start) * 1000)
+    median = statistics.median(timings)
+    print(f"{draws} draws x {len(matchups)} matchups: median {median:.1f} ms, max {max(timings):.1f} ms (target < {TARGET_MS} ms)")
+    for home_id, _ in matchups:
+        print(f"  {odds[home_id]}")
+
+
+if __name__ == "__main__":
+    main()
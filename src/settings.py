@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+from dotenv import dotenv_values
+import os
+import signal
+from typing import Callable, Mapping
+
+ENV_PATH = ".env"
+
+
+def optional_int(value: str | int | None) -> int | None:
+    return None if value is None or value == "" else int(value)
+
+
+def _int_set(value: str | None) -> frozenset[int]:
+    return frozenset(int(v) for v in (value or "").split(",") if v.strip() != "")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Everything the bot reads from .env / the environment, read once. Nothing is allowed to change
+    it in place, a reload swaps in a whole new Settings instead.
+    """
+    discord_token: str | None = None
+    league_id: str | None = None
+    general_channel_id: int | None = None
+    transactions_channel_id: int | None = None
+    rigor: str | None = None
+    db_username: str | None = None
+    db_password: str | None = None
+    db_host: str = "localhost"
+    db_port: int = 5432
+    db_name: str = "sleeper_db"
+    # Discord user ids allowed to run the admin commands (!stats, !profile)
+    admin_ids: frozenset[int] = frozenset()
+    # Where to write the prometheus text metrics, None to not write them
+    metrics_path: str | None = None
+
+    @property
+    def is_dev(self) -> bool:
+        return self.rigor == "DEV"
+
+    @classmethod
+    def from_mapping(cls, values: Mapping[str, str | None]) -> "Settings":
+        return cls(
+            discord_token = values.get("DISCORD_TOKEN"),
+            league_id = values.get("SLEEPER_LEAGUE_ID"),
+            general_channel_id = optional_int(values.get("DISCORD_GENERAL_ID")),
+            transactions_channel_id = optional_int(values.get("DISCORD_TRANSACTIONS_ID")),
+            rigor = values.get("RIGOR"),
+            db_username = values.get("SLEEPER_DB_USERNAME"),
+            db_password = values.get("SLEEPER_DB_PASSWORD"),
+            db_host = values.get("SLEEPER_DB_HOST") or "localhost",
+            db_port = optional_int(values.get("SLEEPER_DB_PORT")) or 5432,
+            db_name = values.get("SLEEPER_DB_NAME") or "sleeper_db",
+            admin_ids = _int_set(values.get("DISCORD_ADMIN_IDS")),
+            metrics_path = values.get("METRICS_PATH") or None,
+        )
+
+    def __repr__(self):
+        # Keep the secrets out of logs
+        return f"Settings(league {self.league_id}, rigor {self.rigor}, db {self.db_username}@{self.db_host}:{self.db_port}/{self.db_name})"
+
+
+def load_settings(env_path: str = ENV_PATH) -> Settings:
+    """
+    Read .env, with real environment variables taking precedence like load_dotenv does
+    """
+    values = dict(dotenv_values(env_path)) if os.path.exists(env_path) else {}
+    values.update(os.environ)
+    return Settings.from_mapping(values)
+
+
+_settings: Settings | None = None
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+def set_settings(settings: Settings) -> None:
+    """
+    Use these settings from now on, e.g. in a script that builds its own instead of reading .env
+    """
+    global _settings
+    _settings = settings
+
+
+def reload_settings() -> Settings:
+    set_settings(load_settings())
+    print(f"Reloaded {_settings}")
+    return _settings
+
+
+def install_reload_handler(loop, on_reload: Callable[[Settings], None] | None = None) -> bool:
+    """
+    Reload the settings when the process gets a SIGHUP. Returns False where there's no SIGHUP (windows).
+    """
+    if not hasattr(signal, "SIGHUP"):
+        return False
+
+    def _reload():
+        settings = reload_settings()
+        if on_reload is not None:
+            on_reload(settings)
+
+    loop.add_signal_handler(signal.SIGHUP, _reload)
+    return True
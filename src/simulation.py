@@ -0,0 +1,108 @@
+import numpy as np
+
+from scoring import PlayerScores
+from sql_tables import Roster
+
+DRAWS = 10000
+# Standard deviation of a player's points over a whole game, as a share of their projection
+VOLATILITY = 0.6
+# Fixed so the odds only move when the scores do, not from one tick's random draws to the next
+SEED = 2025
+
+# league_id -> roster_id -> odds, from the newest snapshot that was simulated
+_latest_odds: dict[str | None, dict[int, "MatchupOdds"]] = {}
+
+
+class MatchupOdds:
+    """
+    One side of a matchup: the chance this roster wins, and its median and 10th / 90th
+    percentile final score over the simulations
+    """
+    def __init__(self, roster_id: int, manager_id: int, opponent_roster_id: int, opponent_manager_id: int, win_probability: float, median: float, low: float, high: float):
+        self.roster_id = roster_id
+        self.manager_id = manager_id
+        self.opponent_roster_id = opponent_roster_id
+        self.opponent_manager_id = opponent_manager_id
+        self.win_probability = win_probability
+        self.median = median
+        self.low = low
+        self.high = high
+
+    def __repr__(self):
+        return f"Roster {self.roster_id} vs {self.opponent_roster_id}: {self.win_probability:.0%} to win, {self.median:.1f} ({self.low:.1f}-{self.high:.1f})"
+
+
+def starter_matrix(scores: PlayerScores, rosters: list[Roster]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (starter positions in scores, starters x rosters 0/1 matrix), for summing player draws into team totals
+    """
+    columns = [[scores.positions[p] for p in (roster.starters or []) if p in scores.positions] for roster in rosters]
+    starters = np.array(sorted({i for column in columns for i in column}), dtype=np.intp)
+    row_of = {position: row for row, position in enumerate(starters)}
+    matrix = np.zeros((len(starters), len(rosters)), dtype=np.float64)
+    for roster_num, column in enumerate(columns):
+        matrix[[row_of[i] for i in column], roster_num] = 1
+    return starters, matrix
+
+
+def simulate_totals(mean: np.ndarray, sd: np.ndarray, matrix: np.ndarray, draws: int = DRAWS, seed: int | None = SEED) -> np.ndarray:
+    """
+    (draws x rosters) simulated final totals. Each starter scores mean + sd * z with z standard normal,
+    so a team total is mean @ matrix + z @ (sd * matrix): every draw for every roster in one matmul.
+    """
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((draws, len(mean)))
+    return mean @ matrix + z @ (sd[:, None] * matrix)
+
+
+def simulate_matchups(scores: PlayerScores, rosters: list[Roster], matchups: list[tuple[int, int]], draws: int = DRAWS, seed: int | None = SEED) -> dict[int, MatchupOdds]:
+    """
+    Win probabilities for every matchup at once, keyed by roster_id. What's still to come for a
+    starter is centred on their projection for the part of the game that's left, with a spread
+    that shrinks as the game runs out.
+    """
+    roster_index = {roster.roster_id: i for i, roster in enumerate(rosters)}
+    matchups = [(home, away) for home, away in matchups if home in roster_index and away in roster_index]
+    if len(matchups) == 0:
+        return {}
+
+    starters, matrix = starter_matrix(scores, rosters)
+    remaining = scores.remaining[starters]
+    projected = scores.projected[starters]
+    mean = scores.current[starters] + projected * remaining
+    sd = VOLATILITY * np.abs(projected) * np.sqrt(remaining)
+    totals = simulate_totals(mean, sd, matrix, draws, seed)
+
+    home = np.array([roster_index[home] for home, _ in matchups], dtype=np.intp)
+    away = np.array([roster_index[away] for _, away in matchups], dtype=np.intp)
+    margin = totals[:, home] - totals[:, away]
+    # A tie counts as half a win for each side
+    home_wins = (margin > 0).mean(axis=0) + 0.5 * (margin == 0).mean(axis=0)
+    low, median, high = np.percentile(totals, [10, 50, 90], axis=0)
+
+    odds = {}
+    for num, (home_id, away_id) in enumerate(matchups):
+        for roster_id, opponent_id, win_probability in [(home_id, away_id, home_wins[num]), (away_id, home_id, 1 - home_wins[num])]:
+            i = roster_index[roster_id]
+            odds[roster_id] = MatchupOdds(
+                roster_id = roster_id,
+                manager_id = rosters[i].manager_id,
+                opponent_roster_id = opponent_id,
+                opponent_manager_id = rosters[roster_index[opponent_id]].manager_id,
+                win_probability = float(win_probability),
+                median = float(median[i]),
+                low = float(low[i]),
+                high = float(high[i])
+            )
+    return odds
+
+
+def set_latest_odds(league_id: str | None, odds: dict[int, MatchupOdds]) -> None:
+    _latest_odds[league_id] = odds
+
+
+def latest_odds(league_id: str | None) -> dict[int, MatchupOdds]:
+    """
+    The odds from the last refresh tick, for rendering without simulating again
+    """
+    return _latest_odds.get(league_id, {})
@@ -1,47 +1,115 @@
-from dotenv import load_dotenv
-import os
-import requests
+import asyncio
 import time
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from constants import SLEEPER_APP_BASE_URL, LEAGUE_ROUTE, MATCHUPS_ROUTE, PLAYERS_ROUTE, ROSTERS_ROUTE, STATE_ROUTE, TRANSACTIONS_ROUTE, USERS_ROUTE
+from graphql_query import GraphQLQuery
+from http_cache import DiskCache, get_cached_json, get_cached_json_async, open_cached
+from http_client import AsyncHttpClient, get_json, post_json
+from json_stream import iter_object_items
+from settings import get_settings
+from sql_tables import Manager, ManagerScore, Transaction, Roster, PLAYER_ATTRIBUTES, player_row
+
+if TYPE_CHECKING:
+    # Both import this module, so only for the annotations
+    from db_helper import DatabaseHelper
+    from snapshot import RefreshSnapshot
+
+SEASON = "2025"
+GRAPHQL_URL = "https://sleeper.com/graphql"
+STAT_FIELDS = ["game_id", "opponent", "player_id", "stats", "team", "week", "season"]
+SCHEDULE_URL = "https://api.sleeper.com/schedule/nfl/regular/2025"
+PLAYERS_URL = f"{SLEEPER_APP_BASE_URL}{PLAYERS_ROUTE}/nfl"
+
+# How long the on-disk copies are trusted when the server doesn't support conditional requests
+PLAYERS_CACHE_TTL = 24 * 60 * 60
+PROJECTIONS_CACHE_TTL = 10 * 60
+# Ingestion watermark holding the version of the players dump a league's players table was last synced from
+PLAYERS_STREAM = "players"
+# Filled in with the season and week by projections_url
+PROJECTIONS_URL = "https://api.sleeper.app/projections/nfl/{season}/{week}?season_type=regular&position[]=DB&position[]=DEF&position[]=DL&position[]=FLEX&position[]=IDP_FLEX&position[]=K&position[]=LB&position[]=QB&position[]=RB&position[]=REC_FLEX&position[]=SUPER_FLEX&position[]=TE&position[]=WR&position[]=WRRB_FLEX&order_by=ppr"
+
 
-from curl_extractor import extract_curl_data
-from espn import get_matchup_timestamps
-from sql_tables import Player, Manager, ManagerScore, Transaction, Roster
+def get_league_id() -> str:
+    return get_settings().league_id
+
+def _league_url(route: str = "", league_id: str | None = None) -> str:
+    if league_id is None:
+        league_id = get_league_id()
+    return f"{SLEEPER_APP_BASE_URL}{LEAGUE_ROUTE}/{league_id}{route}"
 
 
 def get_week():
-    endpoint = "https://api.sleeper.app/v1/state/nfl"
-    r = requests.get(endpoint)
-    response = r.json()
+    response = get_json(f"{SLEEPER_APP_BASE_URL}{STATE_ROUTE}/nfl")
+    return response["week"]
+
+async def get_week_async(client: AsyncHttpClient):
+    response = await client.get_json(f"{SLEEPER_APP_BASE_URL}{STATE_ROUTE}/nfl")
     return response["week"]
 
 
-def get_all_players():
+def get_all_players(prefer_disk: bool = False):
     players = {}
-    endpoint = "https://api.sleeper.app/v1/players/nfl"
-    r = requests.get(endpoint)
-    player_dict = r.json()
+    player_dict = get_cached_json(PLAYERS_URL, "players", PLAYERS_CACHE_TTL, prefer_disk)
     for player_id, player in player_dict.items():
         players[str(player_id)] = player
     return players
 
+def iter_all_players(chunks: Iterable[bytes] | None = None) -> Iterator[tuple[str, dict]]:
+    """
+    Stream the players dump, yielding (player_id, attributes) one player at a time. Only the
+    attributes the players table keeps are held onto, so the full dump is never in memory.
+    """
+    if chunks is None:
+        _, chunks = open_cached(PLAYERS_URL, "players", PLAYERS_CACHE_TTL)
+    chunks = iter(chunks)
+    for player_id, player in iter_object_items(chunks):
+        attributes = {attr: player.get(attr, None) for attr in PLAYER_ATTRIBUTES}
+        attributes["player_id"] = str(player_id)
+        yield str(player_id), attributes
+    # The parser stops at the closing brace, read what's left so the download finishes and gets cached
+    for _ in chunks:
+        pass
+
 def get_scoring_settings() -> dict[str, str]:
-    load_dotenv()
-    league_id = os.getenv("SLEEPER_LEAGUE_ID")
-
-    endpoint = f"https://api.sleeper.app/v1/league/{league_id}"
-    r = requests.get(endpoint)
-    league = r.json()
-    return league["scoring_settings"]
-
-def get_managers() -> list[Manager]:
-    load_dotenv()
-    league_id = os.getenv("SLEEPER_LEAGUE_ID")
-    
-    endpoint = f"https://api.sleeper.app/v1/league/{league_id}/users"
-    r = requests.get(endpoint)
-    
+    # Imported here since league_cache imports this module
+    from league_cache import get_league_cache
+    return get_league_cache().get(get_league_id()).scoring_settings
+
+async def get_scoring_settings_async(client: AsyncHttpClient) -> dict[str, str]:
+    from league_cache import get_league_cache
+    league = await get_league_cache().get_async(client, get_league_id())
+    return league.scoring_settings
+
+def get_league(league_id: str | None = None) -> tuple[dict, list[dict]]:
+    """
+    The league document and its users, as sleeper returns them
+    """
+    return get_json(_league_url(league_id=league_id)), get_json(_league_url(USERS_ROUTE, league_id))
+
+async def get_league_async(client: AsyncHttpClient, league_id: str | None = None) -> tuple[dict, list[dict]]:
+    league, users = await asyncio.gather(
+        client.get_json(_league_url(league_id=league_id)),
+        client.get_json(_league_url(USERS_ROUTE, league_id))
+    )
+    return league, users
+
+def _parse_waiver_weekday(league: dict) -> int:
+    """
+    The day waivers run as a python weekday (0 is Monday). Sleeper counts from Monday too,
+    with Wednesday (2) as the default.
+    """
+    return int(league.get("settings", {}).get("waiver_day_of_week", 2)) % 7
+
+def get_managers(league_id: str | None = None) -> list[Manager]:
+    return _parse_managers(get_json(_league_url(USERS_ROUTE, league_id)))
+
+async def get_managers_async(client: AsyncHttpClient, league_id: str | None = None) -> list[Manager]:
+    return _parse_managers(await client.get_json(_league_url(USERS_ROUTE, league_id)))
+
+def _parse_managers(response: list[dict]) -> list[Manager]:
     managers = []
-    for user in r.json():
+    for user in response:
         manager = Manager(
             manager_id = user["user_id"],
             display_name = user["display_name"],
@@ -53,25 +121,39 @@ def get_managers() -> list[Manager]:
         managers.append(manager)
     return managers
 
-def get_manager_matchups(week: int = 1):
-    load_dotenv()
-    league_id = os.getenv("SLEEPER_LEAGUE_ID")
-    endpoint = f"https://api.sleeper.app/v1/league/{league_id}/matchups/{week}"
-    r = requests.get(endpoint)
-    return r.json()
+def get_manager_matchups(week: int = 1, league_id: str | None = None):
+    return get_json(_league_url(f"{MATCHUPS_ROUTE}/{week}", league_id))
 
-def get_transactions_by_week(week: int = 1):
-    load_dotenv()
-    league_id = os.getenv("SLEEPER_LEAGUE_ID")
+async def get_manager_matchups_async(client: AsyncHttpClient, week: int = 1, league_id: str | None = None):
+    return await client.get_json(_league_url(f"{MATCHUPS_ROUTE}/{week}", league_id))
 
-    endpoint = f"https://api.sleeper.app/v1/league/{league_id}/transactions/{week}"
-    r = requests.get(endpoint)
+def get_matchup_pairs(week: int = 1, league_id: str | None = None) -> list[tuple[int, int]]:
+    return _parse_matchup_pairs(get_manager_matchups(week, league_id))
 
+async def get_matchup_pairs_async(client: AsyncHttpClient, week: int = 1, league_id: str | None = None) -> list[tuple[int, int]]:
+    return _parse_matchup_pairs(await get_manager_matchups_async(client, week, league_id))
+
+def _parse_matchup_pairs(response: list[dict]) -> list[tuple[int, int]]:
+    """
+    (roster_id, roster_id) for each head to head matchup. Rosters without a matchup_id (byes, out of the playoffs) are left out.
+    """
+    matchups: dict[int, list[int]] = {}
+    for matchup in response:
+        if matchup.get("matchup_id") is not None:
+            matchups.setdefault(matchup["matchup_id"], []).append(matchup["roster_id"])
+    return [(roster_ids[0], roster_ids[1]) for _, roster_ids in sorted(matchups.items()) if len(roster_ids) == 2]
+
+def get_transactions_by_week(week: int = 1, league_id: str | None = None):
+    return _parse_transactions(get_json(_league_url(f"{TRANSACTIONS_ROUTE}/{week}", league_id)))
+
+async def get_transactions_by_week_async(client: AsyncHttpClient, week: int = 1, league_id: str | None = None):
+    return _parse_transactions(await client.get_json(_league_url(f"{TRANSACTIONS_ROUTE}/{week}", league_id)))
+
+def _parse_transactions(response: list[dict]) -> list[Transaction]:
     transactions = []
-    for trade in r.json():
-        # TODO: This is a short term hack, players added should be a list for trades
-        added = trade["adds"] if trade["adds"] is None else list(trade["adds"].keys())[0]
-        dropped = trade["drops"] if trade["drops"] is None else list(trade["drops"].keys())[0]
+    for trade in response:
+        added = list((trade["adds"] or {}).keys())
+        dropped = list((trade["drops"] or {}).keys())
         settings = trade["settings"] if isinstance(trade["settings"], dict) else {}
         transaction = Transaction(
             transaction_id = trade["transaction_id"],
@@ -80,24 +162,29 @@ def get_transactions_by_week(week: int = 1):
             status = trade["status"],
             transaction_type = trade["type"],
             week = trade["leg"],
-            player_added = added,
-            player_dropped = dropped,
+            player_added = added[0] if len(added) > 0 else None,
+            player_dropped = dropped[0] if len(dropped) > 0 else None,
             sequence = settings.get("seq", None),
-            waiver_bid = settings.get("waiver_bid", None)
+            waiver_bid = settings.get("waiver_bid", None),
+            players_added = added,
+            players_dropped = dropped,
+            roster_ids = trade.get("roster_ids"),
+            status_updated = trade.get("status_updated") or trade.get("created")
         )
         transactions.append(transaction)
     return transactions
 
-def get_rosters():
-    load_dotenv()
-    league_id = os.getenv("SLEEPER_LEAGUE_ID")
-    
-    endpoint = f"https://api.sleeper.app/v1/league/{league_id}/rosters"
-    response = requests.get(endpoint)
+def get_rosters(league_id: str | None = None):
+    return _parse_rosters(get_json(_league_url(ROSTERS_ROUTE, league_id)))
+
+async def get_rosters_async(client: AsyncHttpClient, league_id: str | None = None):
+    return _parse_rosters(await client.get_json(_league_url(ROSTERS_ROUTE, league_id)))
+
+def _parse_rosters(response: list[dict]) -> list[Roster]:
     refresh_time = int(time.time())
 
     rosters = []
-    for r in response.json():
+    for r in response:
         stats = r["settings"]
         roster = Roster(
             roster_id=r["roster_id"],
@@ -121,12 +208,12 @@ def get_rosters():
     return rosters
 
 def get_game_statuses(week: int):
-    url, headers = extract_curl_data()
-    url = "https://api.sleeper.com/schedule/nfl/regular/2025"
-    
-    response = requests.request("GET", url)
-    print(response.status_code)
-    response = response.json()
+    return _parse_game_statuses(get_json(SCHEDULE_URL), week)
+
+async def get_game_statuses_async(client: AsyncHttpClient, week: int):
+    return _parse_game_statuses(await client.get_json(SCHEDULE_URL), week)
+
+def _parse_game_statuses(response: list[dict], week: int) -> dict[str, str]:
     teams = {}
 
     for game in response:
@@ -135,123 +222,115 @@ def get_game_statuses(week: int):
             teams[game["away"]] = game["status"]
     return teams
 
-def get_projected_scores(roster: Roster):
-    url, headers = extract_curl_data()
-    url = "https://sleeper.com/graphql"
-    week = get_week()
-    
-    player_id_str = "["
-    for player_id in roster.players:
-        player_id_str += "\\\"" + player_id + "\\\""
-    player_id_str += "]"
-
-    payload = "{\"query\":\"query get_player_score_and_projections_batch {\\n        \\n        nfl__regular__2025__4__stat: stats_for_players_in_week(sport: \\\"nfl\\\",season: \\\"2025\\\",category: \\\"stat\\\",season_type: \\\"regular\\\",week: "
-    payload += f"{week},player_ids: {player_id_str}"
-    payload += "){\\n          game_id\\nopponent\\nplayer_id\\nstats\\nteam\\nweek\\nseason\\n        }\\n      \\n\\n        nfl__regular__2025__4__proj: stats_for_players_in_week(sport: \\\"nfl\\\",season: \\\"2025\\\",category: \\\"proj\\\",season_type: \\\"regular\\\",week: "
-    payload += f"{week},player_ids: {player_id_str}"
-    payload += "){\\n          game_id\\nopponent\\nplayer_id\\nstats\\nteam\\nweek\\nseason\\n        }\\n      \\n      }\",\"variables\":{}}"
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-    response = response.json()
-    refresh_time = int(time.time())
-    
-    scoring_settings = get_scoring_settings()
-    projections = get_player_projected_scores()  # TODO: Really shouldn't call this for every manager
-    projections = {p["player_id"]: p for p in projections}
-
-    matchups = get_matchup_timestamps()
-
-    player_stats = {player["player_id"]: player for player in response["data"]["nfl__regular__2025__4__stat"]}
-    player_projs = {player["player_id"]: player for player in response["data"]["nfl__regular__2025__4__proj"]}
-
-    def apply_scoring(score_settings, _stats):
-        _score = 0
-        for category, projection in _stats.items():
-            try:
-                _score += scoring_settings.get(category, 0) * projection
-            except TypeError:
-                pass
-        if stats.get("fga", 0) > 0.1:  # Attempting more than .1 field goals means they are a kicker
-            # TODO: Kickers still don't align perfectly, but it's close enough I'm over it for now
-            _score += score_settings.get("fgmiss", 0) * (stats["fga"] - stats["fgm"]) * 0
-            _score += score_settings.get("xpmiss", 0) * (stats["xpa"] - stats["xpm"]) * 0  # TODO: Does this apply?
-        return _score
-        
-    manager_projected_score = 0
-    for player_id in roster.starters:
-        try:
-            stats = projections[player_id]["stats"]
-            # stats = player_projs[player]
-        except KeyError:
-            # Means the player is on a bye
-            continue
-        projected_score = 0
-        in_game = False
-        if matchups[projections[player_id]["team"]]["in_progress"]:
-            in_game = True
-        projected_score = apply_scoring(scoring_settings, stats)
-        if in_game:
-            # Interpolate by time left in match
-            multiplier = matchups[projections[player_id]["team"]]["time_remaining"] / 60
-            player_current_score = apply_scoring(scoring_settings, player_stats[player_id]["stats"])
-            projected_score = projected_score * multiplier + player_current_score
-        manager_projected_score += projected_score
-
-    manager_current_score = 0
-    for player_id in roster.starters:
-        try:
-            player = player_stats[player_id]
-        except KeyError:
-            # Means the player is on a bye
-            continue
-        stats = player["stats"]
-        try:
-            manager_current_score += apply_scoring(scoring_settings, stats)
-        except KeyError:
-            print(f"KeyError: {player['player_id']} has no attribute pts_half_ppr for manager {roster.manager_id}")
-
+def _player_stats_query(player_ids: list[str], week: int, season: str = SEASON) -> GraphQLQuery:
+    query = GraphQLQuery("get_player_score_and_projections_batch")
+    arguments = {
+        "sport": "nfl",
+        "season": query.variable("season", "String!", season),
+        "season_type": "regular",
+        "week": query.variable("week", "Int!", week),
+        "player_ids": query.variable("player_ids", "[String]!", list(player_ids)),
+    }
+    for category in ["stat", "proj"]:
+        query.field(category, "stats_for_players_in_week", {**arguments, "category": category}, STAT_FIELDS)
+    return query
+
+def _index_player_stats(response: dict) -> dict[str, dict[str, dict]]:
+    """
+    Turn the GraphQL response into {"stat": {player_id: row}, "proj": {player_id: row}}
+    """
+    data = response["data"]
+    return {category: {row["player_id"]: row for row in (data.get(category) or [])} for category in ["stat", "proj"]}
+
+def get_league_stats(player_ids: list[str], week: int, headers: dict[str, str]) -> dict[str, dict[str, dict]]:
+    """
+    One request for the current stats and projections of every player passed in, meant
+    to be called with the union of all rostered players in the league.
+    """
+    response = post_json(GRAPHQL_URL, headers=headers, json=_player_stats_query(player_ids, week).payload())
+    return _index_player_stats(response)
+
+async def get_league_stats_async(client: AsyncHttpClient, player_ids: list[str], week: int, headers: dict[str, str]) -> dict[str, dict[str, dict]]:
+    response = await client.post_json(GRAPHQL_URL, headers=headers, json=_player_stats_query(player_ids, week).payload())
+    return _index_player_stats(response)
+
+def rostered_player_ids(rosters: list[Roster]) -> list[str]:
+    player_ids = set()
+    for roster in rosters:
+        player_ids.update(roster.players or [])
+    return sorted(player_ids)
+
+def get_projected_scores(roster: Roster, snapshot: "RefreshSnapshot | None" = None):
+    if snapshot is None:
+        from snapshot import build_snapshot
+        snapshot = build_snapshot()
+    return score_roster(roster, snapshot)
+
+def score_roster(roster: Roster, snapshot: "RefreshSnapshot") -> ManagerScore:
+    # Every rostered player in the league is scored once per snapshot, this just sums the starters
+    manager_current_score, manager_projected_score = snapshot.player_scores.totals(roster.starters)
     manager_score = ManagerScore(
         manager_id = roster.manager_id,
-        timestamp = refresh_time,
+        timestamp = int(time.time()),
         projected_score = manager_projected_score,
         current_score = manager_current_score
     )
     return manager_score
 
-def get_player_projected_scores():
-    endpoint = "https://api.sleeper.app/projections/nfl/2025/8?season_type=regular&position[]=DB&position[]=DEF&position[]=DL&position[]=FLEX&position[]=IDP_FLEX&position[]=K&position[]=LB&position[]=QB&position[]=RB&position[]=REC_FLEX&position[]=SUPER_FLEX&position[]=TE&position[]=WR&position[]=WRRB_FLEX&order_by=ppr"
-
-    response = requests.get(endpoint)
-
-    return response.json()
-
-
-def update_players():
-    db_helper = DatabaseHelper()
-    get_all_players(db_helper)
-    
-    count = 0
-    outer_count = 0
-    for player, player_info in players.items():
-        try:
-            player_info["weight"] = int(player_info.get("weight", None))
-        except (ValueError, TypeError):
-            player_info["weight"] = None
-        player = Player(player_info)
-        db_helper.db_session.add(player)
-        count += 1
-        if count > 999:
-            db_helper.db_session.commit()
-            count = 0
-            outer_count += 1
-            print(f"Committed {outer_count * 1000} players!")
-    db_helper.db_session.commit()
-    print(f"Committed {outer_count * 1000 + count} players!")
+def projections_url(week: int) -> str:
+    return PROJECTIONS_URL.format(season=SEASON, week=week)
+
+def projections_cache_name(week: int) -> str:
+    """
+    Each week's projections get their own disk cache entry
+    """
+    return f"projections_{SEASON}_{week}"
+
+def get_player_projected_scores(week: int, prefer_disk: bool = False):
+    return get_cached_json(projections_url(week), projections_cache_name(week), PROJECTIONS_CACHE_TTL, prefer_disk)
+
+async def get_player_projected_scores_async(client: AsyncHttpClient, week: int, prefer_disk: bool = False):
+    return await get_cached_json_async(client, projections_url(week), projections_cache_name(week), PROJECTIONS_CACHE_TTL, prefer_disk)
+
+
+def update_players(db_helpers: "list[DatabaseHelper] | None" = None, force: bool = False) -> list[dict[str, int | float]] | None:
+    """
+    Refresh the players table of every league from the full Sleeper player dump. If the dump
+    hasn't changed since it was last downloaded only the leagues that haven't been synced from
+    this copy yet (e.g. one that was just added) are, unless forced. The dump is downloaded once,
+    every league after the first reads it back from the disk cache.
+    """
+    changed, chunks = open_cached(PLAYERS_URL, "players", PLAYERS_CACHE_TTL)
+    if db_helpers is None:
+        from db_helper import DatabaseHelper
+        from leagues import load_leagues
+        db_helpers = [DatabaseHelper(league.league_id, league.db_schema) for league in load_leagues()]
+    if not changed and not force:
+        version = DiskCache("players").version()
+        db_helpers = [db_helper for db_helper in db_helpers if (db_helper.get_watermark(db_helper.league_id, PLAYERS_STREAM).value or 0) < version]
+        if len(db_helpers) == 0:
+            print("Players dump unchanged, skipping sync")
+            return None
+    refresh_time = int(time.time())
+    results = []
+    for db_helper in db_helpers:
+        if chunks is None:
+            _, chunks = open_cached(PLAYERS_URL, "players", PLAYERS_CACHE_TTL, prefer_disk=True)
+        results.append(db_helper.sync_players(player_row(player_info, refresh_time) for _, player_info in iter_all_players(chunks)))
+        chunks = None
+        # Read after the sync, a fresh download is only on disk once it has been read through
+        watermark = db_helper.get_watermark(db_helper.league_id, PLAYERS_STREAM)
+        watermark.value = DiskCache("players").version()
+        watermark.updated_on = refresh_time
+        db_helper.db_session.commit()
+    if changed and not DiskCache("players").exists():
+        print("Players dump wasn't cached, the next sync will download it again")
+    return results
 
 
 if __name__ == "__main__":
-    from db_helper import DatabaseHelper
-    db = DatabaseHelper()
+    from db_helper import DatabaseHelper as _DatabaseHelper
+    db = _DatabaseHelper()
     # # get_rosters(db)
     # #managers = get_managers(db)
     # #print(managers) 
@@ -0,0 +1,255 @@
+import asyncio
+import numpy as np
+import time
+
+from curl_extractor import extract_curl_data
+from espn import get_matchup_timestamps, get_matchup_timestamps_async
+from http_cache import load_cached_json
+from http_client import AsyncHttpClient
+from league_cache import get_league_cache
+from metrics import get_metrics
+from sleeper import (
+    get_game_statuses, get_game_statuses_async,
+    get_league_stats, get_league_stats_async,
+    get_matchup_pairs, get_matchup_pairs_async,
+    get_player_projected_scores, get_player_projected_scores_async,
+    get_rosters, get_rosters_async,
+    get_league_id,
+    get_week, get_week_async,
+    projections_cache_name,
+    rostered_player_ids
+)
+from scoring import CompiledScoring, PlayerScores, score_players
+from lineup import Lineup, optimize_rosters, set_latest_lineups
+from simulation import MatchupOdds, set_latest_odds, simulate_matchups
+from sql_tables import Roster
+
+# How many seconds a fetched endpoint is reused for before a snapshot fetches it again.
+# 0 means every snapshot fetches it, but still only once per snapshot.
+FRESHNESS = {
+    "week": 15 * 60,
+    "projections": 10 * 60,
+    "schedule": 60 * 60,
+    "matchups": 60 * 60,
+    "scoreboard": 0,
+    "rosters": 0,
+    "stats": 0,
+}
+
+# (endpoint, key) -> (fetched_on, value)
+_cache: dict[tuple[str, object], tuple[float, object]] = {}
+
+# Projected scores only change when projections, scoring settings or the rostered players do, so
+# they're kept between ticks per league as (raw projections, scoring settings, player_ids, projected scores)
+_projected_scores: dict[str | None, tuple[list[dict], dict, list[str], np.ndarray]] = {}
+
+
+class RefreshSnapshot:
+    """
+    Everything a refresh tick needs from upstream, gathered once and then handed to
+    get_projected_scores, DatabaseHelper.update_rosters and check_late_starter_swap.
+    """
+    def __init__(self, week: int, scoring_settings: dict, projections: list[dict], schedule: dict[str, str], scoreboard: dict, rosters: list[Roster], league_stats: dict[str, dict[str, dict]], graphql_headers: dict[str, str], fetched_on: int | None = None, compiled_scoring: CompiledScoring | None = None, league_id: str | None = None, matchups: list[tuple[int, int]] | None = None, roster_positions: list[str] | None = None):
+        self.league_id = league_id
+        self.week = week
+        self.scoring_settings = scoring_settings
+        self.compiled_scoring = CompiledScoring(scoring_settings) if compiled_scoring is None else compiled_scoring
+        # Indexed once here instead of once per roster
+        self.raw_projections = projections
+        self.projections = {p["player_id"]: p for p in projections}
+        self.schedule = schedule
+        self.scoreboard = scoreboard
+        self.rosters = rosters
+        # This week's (roster_id, roster_id) pairings
+        self.matchups = [] if matchups is None else matchups
+        # The league's lineup slots, starting slots and bench alike
+        self.roster_positions = [] if roster_positions is None else roster_positions
+        # Live stats and GraphQL projections for every rostered player, keyed by player_id
+        self.player_stats = league_stats["stat"]
+        self.player_projs = league_stats["proj"]
+        self.graphql_headers = graphql_headers
+        self.fetched_on = int(time.time()) if fetched_on is None else fetched_on
+        self._player_scores: PlayerScores | None = None
+        self._matchup_odds: dict[int, MatchupOdds] | None = None
+        self._lineups: dict[str, dict[int, Lineup]] = {}
+
+    @property
+    def player_scores(self) -> PlayerScores:
+        """
+        Scores for every rostered player, computed the first time a roster is scored from this snapshot.
+        """
+        if self._player_scores is None:
+            player_ids = rostered_player_ids(self.rosters)
+            projected = None
+            if self.league_id in _projected_scores:
+                raw_projections, scoring_settings, scored_ids, scores = _projected_scores[self.league_id]
+                if raw_projections is self.raw_projections and scoring_settings is self.scoring_settings and scored_ids == player_ids:
+                    projected = scores
+            with get_metrics().span("scoring_seconds", reused_projections=projected is not None):
+                self._player_scores = score_players(
+                    self.compiled_scoring,
+                    player_ids,
+                    self.projections,
+                    self.player_stats,
+                    self.scoreboard,
+                    projected=projected
+                )
+            _projected_scores[self.league_id] = (self.raw_projections, self.scoring_settings, player_ids, self._player_scores.projected)
+        return self._player_scores
+
+    @property
+    def matchup_odds(self) -> dict[int, MatchupOdds]:
+        """
+        Simulated win probabilities for this week's matchups, keyed by roster_id. Also kept as the
+        league's latest odds for display_roster.
+        """
+        if self._matchup_odds is None:
+            with get_metrics().span("simulation_seconds"):
+                self._matchup_odds = simulate_matchups(self.player_scores, self.rosters, self.matchups)
+            set_latest_odds(self.league_id, self._matchup_odds)
+        return self._matchup_odds
+
+    def optimal_lineups(self, positions: dict[str, list[str]], measure: str = "projected") -> dict[int, Lineup]:
+        """
+        Every roster's optimal lineup by measure ("projected" or "actual"), keyed by roster_id.
+        positions comes from the database, player_id -> fantasy_positions. Also kept as the league's latest lineups.
+        """
+        if measure not in self._lineups:
+            with get_metrics().span("lineup_seconds", measure=measure):
+                self._lineups[measure] = optimize_rosters(self.player_scores, self.rosters, self.roster_positions, positions, measure)
+            set_latest_lineups(self.league_id, measure, self._lineups[measure])
+        return self._lineups[measure]
+
+    def __repr__(self) -> str:
+        return f"RefreshSnapshot(league {self.league_id}, week {self.week}, {len(self.rosters)} rosters, fetched at {self.fetched_on})"
+
+
+def warm_start(week: int | None = None) -> None:
+    """
+    Seed the endpoint cache from what's on disk so the first snapshot after a restart doesn't
+    have to download this week's projections. They're refetched as usual once their freshness runs out.
+    """
+    week = get_week() if week is None else week
+    cached = load_cached_json(projections_cache_name(week))
+    if cached is not None and ("projections", week) not in _cache:
+        fetched_on, projections = cached
+        _cache[("projections", week)] = (fetched_on, projections)
+
+
+def invalidate(endpoint: str | None = None) -> None:
+    """
+    Drop cached endpoint values so the next snapshot refetches them. Clears everything if no endpoint is given.
+    """
+    if endpoint is None:
+        _cache.clear()
+        return
+    for name, key in list(_cache.keys()):
+        if name == endpoint:
+            del _cache[(name, key)]
+
+
+def _cached(endpoint: str, now: float, freshness: dict[str, float], key: object = None):
+    cached = _cache.get((endpoint, key))
+    if cached is not None and now - cached[0] < freshness.get(endpoint, 0):
+        return True, cached[1]
+    return False, None
+
+
+def _fetch(endpoint: str, now: float, freshness: dict[str, float], fetch, key: object = None):
+    hit, value = _cached(endpoint, now, freshness, key)
+    if not hit:
+        value = fetch()
+        _cache[(endpoint, key)] = (now, value)
+    return value
+
+
+async def _fetch_async(endpoint: str, now: float, freshness: dict[str, float], fetch, key: object = None):
+    hit, value = _cached(endpoint, now, freshness, key)
+    if not hit:
+        value = await fetch()
+        _cache[(endpoint, key)] = (now, value)
+    return value
+
+
+def build_snapshots(league_ids: list[str], freshness: dict[str, float] | None = None) -> dict[str, RefreshSnapshot]:
+    """
+    Snapshots for several leagues at once. Everything that isn't league specific (week, projections,
+    schedule, scoreboard) is fetched once, and so are the stats, for every league's players together.
+    """
+    freshness = FRESHNESS if freshness is None else freshness
+    now = time.time()
+    week = _fetch("week", now, freshness, get_week)
+    _, headers = extract_curl_data()
+    rosters = {league_id: _fetch("rosters", now, freshness, lambda: get_rosters(league_id), key=league_id) for league_id in league_ids}
+    player_ids = rostered_player_ids([roster for league_rosters in rosters.values() for roster in league_rosters])
+    projections = _fetch("projections", now, freshness, lambda: get_player_projected_scores(week), key=week)
+    schedule = _fetch("schedule", now, freshness, lambda: get_game_statuses(week), key=week)
+    scoreboard = _fetch("scoreboard", now, freshness, get_matchup_timestamps)
+    league_stats = _fetch("stats", now, freshness, lambda: get_league_stats(player_ids, week, headers), key=week)
+    matchups = {league_id: _fetch("matchups", now, freshness, lambda: get_matchup_pairs(week, league_id), key=(league_id, week)) for league_id in league_ids}
+    leagues = {league_id: get_league_cache().get(league_id) for league_id in league_ids}
+    return {
+        league_id: _snapshot(league_id, week, leagues[league_id], projections, schedule, scoreboard, rosters[league_id], league_stats, headers, now, matchups[league_id])
+        for league_id in league_ids
+    }
+
+
+def build_snapshot(freshness: dict[str, float] | None = None, league_id: str | None = None) -> RefreshSnapshot:
+    league_id = get_league_id() if league_id is None else league_id
+    return build_snapshots([league_id], freshness)[league_id]
+
+
+async def build_snapshots_async(client: AsyncHttpClient, league_ids: list[str], freshness: dict[str, float] | None = None) -> dict[str, RefreshSnapshot]:
+    freshness = FRESHNESS if freshness is None else freshness
+    now = time.time()
+    week = await _fetch_async("week", now, freshness, lambda: get_week_async(client))
+    _, headers = extract_curl_data()
+
+    async def _rosters_and_stats():
+        # The stats query needs every rostered player, so it has to wait on the rosters
+        _rosters = await asyncio.gather(*[
+            _fetch_async("rosters", now, freshness, lambda league_id=league_id: get_rosters_async(client, league_id), key=league_id)
+            for league_id in league_ids
+        ])
+        player_ids = rostered_player_ids([roster for league_rosters in _rosters for roster in league_rosters])
+        _stats = await _fetch_async("stats", now, freshness, lambda: get_league_stats_async(client, player_ids, week, headers), key=week)
+        return dict(zip(league_ids, _rosters)), _stats
+
+    leagues, matchups, projections, schedule, scoreboard, (rosters, league_stats) = await asyncio.gather(
+        asyncio.gather(*[get_league_cache().get_async(client, league_id) for league_id in league_ids]),
+        asyncio.gather(*[
+            _fetch_async("matchups", now, freshness, lambda league_id=league_id: get_matchup_pairs_async(client, week, league_id), key=(league_id, week))
+            for league_id in league_ids
+        ]),
+        _fetch_async("projections", now, freshness, lambda: get_player_projected_scores_async(client, week), key=week),
+        _fetch_async("schedule", now, freshness, lambda: get_game_statuses_async(client, week), key=week),
+        _fetch_async("scoreboard", now, freshness, lambda: get_matchup_timestamps_async(client)),
+        _rosters_and_stats()
+    )
+    return {
+        league_id: _snapshot(league_id, week, league, projections, schedule, scoreboard, rosters[league_id], league_stats, headers, now, league_matchups)
+        for league_id, league, league_matchups in zip(league_ids, leagues, matchups)
+    }
+
+
+async def build_snapshot_async(client: AsyncHttpClient, freshness: dict[str, float] | None = None, league_id: str | None = None) -> RefreshSnapshot:
+    league_id = get_league_id() if league_id is None else league_id
+    return (await build_snapshots_async(client, [league_id], freshness))[league_id]
+
+
+def _snapshot(league_id: str, week: int, league, projections, schedule, scoreboard, rosters, league_stats, headers, now: float, matchups: list[tuple[int, int]]) -> RefreshSnapshot:
+    return RefreshSnapshot(
+        week = week,
+        scoring_settings = league.scoring_settings,
+        compiled_scoring = league.compiled_scoring,
+        projections = projections,
+        schedule = schedule,
+        scoreboard = scoreboard,
+        rosters = rosters,
+        league_stats = league_stats,
+        graphql_headers = headers,
+        fetched_on = int(now),
+        league_id = league_id,
+        matchups = matchups,
+        roster_positions = league.roster_positions
+    )
@@ -1,10 +1,63 @@
+import hashlib
+import json
 import numpy as np
 import time
 import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column
 
 Base = declarative_base()
 
+# The attributes of a Sleeper player dict that get kept in the players table
+PLAYER_ATTRIBUTES = [
+    "player_id",
+    "full_name",
+    "first_name",
+    "last_name",
+    "fantasy_positions",
+    "position",
+    "team_abbr",
+    "team",
+    "status",
+    "number",
+    "height",
+    "weight",
+    "years_exp",
+    "depth_chart_order",
+    "injury_notes",
+    "injury_body_part",
+    "injury_status",
+    "news_updated",
+    "college",
+    "high_school",
+    "birth_city",
+    "birth_state",
+    "birth_country",
+    "birth_date",
+    "search_rank"
+]
+
+
+def _to_number(value, number_type):
+    try:
+        return number_type(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def player_row(player_attributes: dict, refreshed_on: int | None = None) -> dict:
+    """
+    Project a Sleeper player dict down to the players table columns, plus a hash of the
+    content so unchanged players can be skipped when syncing.
+    """
+    row = {attr: player_attributes.get(attr, None) for attr in PLAYER_ATTRIBUTES}
+    row["player_id"] = str(row["player_id"])
+    row["number"] = _to_number(row["number"], int)
+    row["weight"] = _to_number(row["weight"], float)
+    row["content_hash"] = hashlib.md5(json.dumps([row[attr] for attr in PLAYER_ATTRIBUTES], default=str).encode()).hexdigest()
+    row["refreshed_on"] = int(time.time()) if refreshed_on is None else refreshed_on
+    return row
+
 class Player(Base):
     __tablename__ = "players"
 
@@ -37,45 +90,13 @@ class Player(Base):
 
     search_rank: int = sql.Column(sql.Integer)
 
+    content_hash: str = sql.Column(sql.Text)
     refreshed_on: int = sql.Column(sql.BigInteger)
 
 
     def __init__(self, player_attributes: dict, refreshed_on: int = None) -> None:
-        attributes = [
-            "player_id",
-            "full_name",
-            "first_name",
-            "last_name",
-            "fantasy_positions",
-            "position",
-            "team_abbr",
-            "team",
-            "status",
-            "number",
-            "height",
-            "weight",
-            "years_exp",
-            "depth_chart_order",
-            "injury_notes",
-            "injury_body_part",
-            "injury_status",
-            "news_updated",
-            "college",
-            "high_school",
-            "birth_city",
-            "birth_state",
-            "birth_country",
-            "birth_date",
-            "seach_rank"
-        ]
-
-        for _attr in attributes:
-            setattr(self, _attr, player_attributes.get(_attr, None))
-
-        if refreshed_on is None:
-            self.refreshed_on = int(time.time())
-        else:
-            self.refreshed_on = refreshed_on
+        for _attr, value in player_row(player_attributes, refreshed_on).items():
+            setattr(self, _attr, value)
 
     def __repr__(self) -> str:
         return f"[{self.position}] {self.first_name} {self.last_name}"
@@ -121,6 +142,11 @@ class Manager(Base):
 
 class ManagerScore(Base):
     __tablename__ = "manager_scores"
+    # The primary key already covers per manager range scans, this one is for "everyone in this window"
+    __table_args__ = (
+        sql.Index("ix_manager_scores_timestamp", "timestamp"),
+    )
+
     manager_id: int = sql.Column(sql.BigInteger, primary_key = True)
     timestamp: int = sql.Column(sql.BigInteger, primary_key = True)
     projected_score: float = sql.Column(sql.Float)
@@ -161,12 +187,18 @@ class Transaction(Base):
     transaction_type: str = sql.Column(sql.Text)
     week: int = sql.Column(sql.Integer)
 
+    # First player added/dropped, kept for older queries. players_added/players_dropped have all of them
     player_added: str = sql.Column(sql.Text, sql.ForeignKey("players.player_id"))
     player_dropped: str = sql.Column(sql.Text, sql.ForeignKey("players.player_id"))
+    players_added: list[str] = sql.Column(sql.ARRAY(sql.Text))
+    players_dropped: list[str] = sql.Column(sql.ARRAY(sql.Text))
+    roster_ids: list[int] = sql.Column(sql.ARRAY(sql.Integer))
     sequence: int = sql.Column(sql.Integer)
     waiver_bid: int = sql.Column(sql.Integer)
+    league_id: str = sql.Column(sql.Text)
+    status_updated: int = sql.Column(sql.BigInteger, index=True)
 
-    def __init__(self, transaction_id: int, manager_id: int, status: str, transaction_type: str, week: int, player_added: str, player_dropped: str, consenter_id: str = None, sequence: int = 0, waiver_bid: int = 0):
+    def __init__(self, transaction_id: int, manager_id: int, status: str, transaction_type: str, week: int, player_added: str, player_dropped: str, consenter_id: str = None, sequence: int = 0, waiver_bid: int = 0, players_added: list[str] | None = None, players_dropped: list[str] | None = None, roster_ids: list[int] | None = None, league_id: str | None = None, status_updated: int | None = None):
         self.transaction_id = transaction_id
         self.manager_id = manager_id
         self.consenter_id = consenter_id
@@ -177,6 +209,86 @@ class Transaction(Base):
         self.player_dropped = player_dropped
         self.sequence = sequence
         self.waiver_bid = waiver_bid
+        self.players_added = players_added if players_added is not None else [p for p in [player_added] if p is not None]
+        self.players_dropped = players_dropped if players_dropped is not None else [p for p in [player_dropped] if p is not None]
+        self.roster_ids = roster_ids
+        self.league_id = league_id
+        self.status_updated = status_updated
+
+    def __repr__(self):
+        return f"Transaction {self.transaction_id} ({self.transaction_type}, {self.status})"
+
+
+class LeagueMetadata(Base):
+    """
+    The league document and user list from sleeper, kept so a restart doesn't have to refetch them
+    """
+    __tablename__ = "league_metadata"
+
+    league_id: str = sql.Column(sql.Text, primary_key=True)
+    name: str = sql.Column(sql.Text)
+    season: str = sql.Column(sql.Text)
+    league: dict = sql.Column(JSONB)
+    users: list[dict] = sql.Column(JSONB)
+    content_hash: str = sql.Column(sql.Text)
+    fetched_on: int = sql.Column(sql.BigInteger)
+
+    def __init__(self, league_id: str, league: dict, users: list[dict], fetched_on: int):
+        self.league_id = league_id
+        self.name = league.get("name")
+        self.season = league.get("season")
+        self.league = league
+        self.users = users
+        self.content_hash = hashlib.md5(json.dumps([league, users], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        self.fetched_on = fetched_on
+
+    def __repr__(self):
+        return f"League {self.league_id} ({self.name}, {self.season})"
+
+
+class IngestionWatermark(Base):
+    """
+    How far an incremental ingestion stream (e.g. transactions) has gotten for a league
+    """
+    __tablename__ = "ingestion_watermarks"
+
+    league_id: str = sql.Column(sql.Text, primary_key=True)
+    stream: str = sql.Column(sql.Text, primary_key=True)
+    value: int = sql.Column(sql.BigInteger)
+    week: int = sql.Column(sql.Integer)
+    updated_on: int = sql.Column(sql.BigInteger)
+
+    def __init__(self, league_id: str, stream: str, value: int = 0, week: int | None = None, updated_on: int | None = None):
+        self.league_id = league_id
+        self.stream = stream
+        self.value = value
+        self.week = week
+        self.updated_on = updated_on
+
+    def __repr__(self):
+        return f"Watermark {self.stream} for {self.league_id}: {self.value} (week {self.week})"
+
+
+# Roster fields that make up its fingerprint, a change to any of them means the roster gets rewritten
+ROSTER_COMPARISON_FIELDS = [
+    "players",
+    "starters",
+    "reserve",
+    "streak",
+    "wins",
+    "losses",
+    "ties",
+    "points_for",
+    "points_against",
+    "potential_points",
+    "total_moves",
+    "waiver_budget_used"
+]
+
+
+def roster_fingerprint(roster: "Roster") -> str:
+    values = [getattr(roster, field) for field in ROSTER_COMPARISON_FIELDS]
+    return hashlib.md5(json.dumps(values, default=str).encode()).hexdigest()
 
 
 class Roster(Base):
@@ -198,6 +310,7 @@ class Roster(Base):
     waiver_budget_used: int = sql.Column(sql.Integer)
     waiver_position: int = sql.Column(sql.Integer)
     refreshed_on: int = sql.Column(sql.BigInteger)
+    fingerprint: str = sql.Column(sql.Text)
 
     def __init__(self, roster_id: int, manager_id: int, players: list[str], starters: list[str], reserve: list[str], streak: str, wins: int, losses: int, ties: int, points_for: float, points_against: float, potential_points: float, total_moves: int, waiver_budget_used: int, waiver_position: int, refreshed_on: int): 
         self.roster_id = roster_id 
@@ -216,17 +329,44 @@ class Roster(Base):
         self.waiver_budget_used = waiver_budget_used
         self.waiver_position = waiver_position
         self.refreshed_on = refreshed_on
+        self.fingerprint = roster_fingerprint(self)
 
 
-"""
-# This would make roster queries easier
-class RosterPlayers(Base):
+class RosterPlayer(Base):
+    """
+    One row per player on a roster for a given week, so membership questions like
+    "which roster has player X" are index lookups instead of array scans.
+    """
     __tablename__ = "roster_players"
+    __table_args__ = (
+        sql.Index("ix_roster_players_player_week", "player_id", "season", "week"),
+    )
 
-    roster_id: int = sql.Column(sql.Integer, sql.ForeignKey('rosters.roster_id'))
-    player_id: str = sql.Column(sql.Text, sql.ForeignKey('players.player_id'))
+    season: int = sql.Column(sql.Integer, primary_key=True)
+    week: int = sql.Column(sql.Integer, primary_key=True)
+    roster_id: int = sql.Column(sql.Integer, sql.ForeignKey("rosters.roster_id"), primary_key=True)
+    player_id: str = sql.Column(sql.Text, primary_key=True)
     starter: bool = sql.Column(sql.Boolean)
     reserve: bool = sql.Column(sql.Boolean)
-"""
 
+    def __init__(self, season: int, week: int, roster_id: int, player_id: str, starter: bool, reserve: bool):
+        self.season = season
+        self.week = week
+        self.roster_id = roster_id
+        self.player_id = player_id
+        self.starter = starter
+        self.reserve = reserve
 
+    def __repr__(self):
+        return f"Roster {self.roster_id} week {self.week}: {self.player_id}{' (starter)' if self.starter else ''}"
+
+
+def roster_player_flags(roster: Roster) -> dict[str, tuple[bool, bool]]:
+    """
+    {player_id: (starter, reserve)} for everyone on a roster. Sleeper fills empty starter slots with "0".
+    """
+    starters = set(roster.starters or [])
+    reserve = set(roster.reserve or [])
+    player_ids = set(roster.players or []) | starters | reserve
+    player_ids.discard("0")
+    return {player_id: (player_id in starters, player_id in reserve) for player_id in player_ids}
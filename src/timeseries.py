@@ -0,0 +1,153 @@
+import time
+
+import numpy as np
+import sqlalchemy as sql
+from sqlalchemy.orm import Session
+
+from sql_tables import IngestionWatermark, ManagerScore
+
+# Scores get written every 3 minutes. Once a week is over nobody needs that resolution,
+# so older points get thinned down to one per COMPACT_RESOLUTION bucket.
+RAW_RETENTION = 7 * 24 * 3600
+COMPACT_RESOLUTION = 15 * 60
+COMPACTION_STREAM = "manager_scores_compacted"
+# Fantasy weeks roll over on Tuesday morning after Monday night's game. 1970-01-06 was a Tuesday.
+WEEK = 7 * 24 * 3600
+WEEK_START = (5 * 24 + 8) * 3600
+
+SCORE_DTYPE = np.dtype([
+    ("manager_id", np.int64),
+    ("timestamp", np.int64),
+    ("current_score", np.float64),
+    ("projected_score", np.float64),
+])
+
+_COMPACT_SQL = sql.text("""
+    DELETE FROM manager_scores s
+    USING (
+        SELECT manager_id, timestamp,
+               row_number() OVER (PARTITION BY manager_id, timestamp / :resolution ORDER BY timestamp DESC) AS rn
+        FROM manager_scores
+        WHERE timestamp >= :start AND timestamp < :end
+    ) ranked
+    WHERE s.manager_id = ranked.manager_id AND s.timestamp = ranked.timestamp AND ranked.rn > 1
+""")
+
+
+class ScoreSeries:
+    """
+    One manager's score history as parallel numpy arrays, ordered by timestamp
+    """
+    def __init__(self, manager_id: int, timestamps: np.ndarray, current_scores: np.ndarray, projected_scores: np.ndarray):
+        self.manager_id = manager_id
+        self.timestamps = timestamps
+        self.current_scores = current_scores
+        self.projected_scores = projected_scores
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __repr__(self):
+        return f"ScoreSeries {self.manager_id}: {len(self)} points"
+
+
+def weekly_finals(series: ScoreSeries, now: int | None = None) -> np.ndarray:
+    """
+    The final score of every finished fantasy week in the series, i.e. the last point before each rollover
+    """
+    if len(series) == 0:
+        return np.zeros(0, dtype=np.float64)
+    now = int(time.time()) if now is None else now
+    weeks = (series.timestamps - WEEK_START) // WEEK
+    last_of_week = np.append(weeks[1:] != weeks[:-1], True)
+    finals = series.current_scores[last_of_week & (weeks < (now - WEEK_START) // WEEK)]
+    return finals[~np.isnan(finals)]
+
+
+def load_scores(session: Session, start: int | None = None, end: int | None = None, manager_ids: list[int] | None = None, windows: list[tuple[int, int]] | None = None) -> np.ndarray:
+    """
+    Every score point in [start, end) as one structured array (SCORE_DTYPE), sorted by manager then time.
+    windows narrows it down further to points inside any of the given [start, end) ranges,
+    an empty list of windows (e.g. no games that week) matches nothing.
+    """
+    if windows is not None and len(windows) == 0:
+        return np.zeros(0, dtype=SCORE_DTYPE)
+    nan = sql.literal(float("nan"), sql.Float)
+    q = sql.select(
+        ManagerScore.manager_id,
+        ManagerScore.timestamp,
+        sql.func.coalesce(ManagerScore.current_score, nan),
+        sql.func.coalesce(ManagerScore.projected_score, nan),
+    )
+    if start is not None:
+        q = q.where(ManagerScore.timestamp >= start)
+    if end is not None:
+        q = q.where(ManagerScore.timestamp < end)
+    if windows is not None:
+        q = q.where(sql.or_(*[
+            sql.and_(ManagerScore.timestamp >= window_start, ManagerScore.timestamp < window_end)
+            for window_start, window_end in windows
+        ]))
+    if manager_ids is not None:
+        q = q.where(ManagerScore.manager_id.in_([int(manager_id) for manager_id in manager_ids]))
+    q = q.order_by(ManagerScore.manager_id, ManagerScore.timestamp)
+    result = session.connection().execute(q)
+    return np.fromiter((tuple(row) for row in result), dtype=SCORE_DTYPE)
+
+
+def split_by_manager(points: np.ndarray) -> dict[int, ScoreSeries]:
+    """
+    Split a load_scores array into a ScoreSeries per manager without copying
+    """
+    if len(points) == 0:
+        return {}
+    manager_ids, starts = np.unique(points["manager_id"], return_index=True)
+    ends = np.append(starts[1:], len(points))
+    series = {}
+    for manager_id, start, end in zip(manager_ids.tolist(), starts, ends):
+        chunk = points[start:end]
+        series[manager_id] = ScoreSeries(manager_id, chunk["timestamp"], chunk["current_score"], chunk["projected_score"])
+    return series
+
+
+def score_series(session: Session, start: int | None = None, end: int | None = None, manager_ids: list[int] | None = None, windows: list[tuple[int, int]] | None = None) -> dict[int, ScoreSeries]:
+    """
+    Score history of every (or the given) manager in [start, end), in one query
+    """
+    return split_by_manager(load_scores(session, start, end, manager_ids, windows))
+
+
+def elapsed_time(timestamps: np.ndarray, windows: list[tuple[int, int]]) -> np.ndarray:
+    """
+    Seconds of game time elapsed at each timestamp, counting only time inside the windows.
+    This is what the weekly plots use as their x axis so the gaps between game days disappear.
+    """
+    if len(windows) == 0:
+        return np.zeros(len(timestamps), dtype=np.int64)
+    starts = np.array([window_start for window_start, _ in windows], dtype=np.int64)
+    lengths = np.array([window_end - window_start for window_start, window_end in windows], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    idx = np.clip(np.searchsorted(starts, timestamps, side="right") - 1, 0, len(windows) - 1)
+    return timestamps - starts[idx] + offsets[idx]
+
+
+def compact_scores(session: Session, watermark: IngestionWatermark, now: int | None = None, raw_retention: int = RAW_RETENTION, resolution: int = COMPACT_RESOLUTION) -> int:
+    """
+    Keep only the last point of every resolution sized bucket for scores older than raw_retention.
+    Picks up where the last run stopped, so each run only touches the newly expired points.
+    Returns how many rows were deleted.
+    """
+    if now is None:
+        now = int(time.time())
+    # Only compact whole buckets so a later run never splits one
+    end = (now - raw_retention) // resolution * resolution
+
+    start = watermark.value or 0
+    if end <= start:
+        return 0
+
+    result = session.execute(_COMPACT_SQL, {"resolution": resolution, "start": start, "end": end})
+    watermark.value = end
+    watermark.updated_on = now
+    session.commit()
+    return result.rowcount
@@ -0,0 +1,110 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from typing import Callable
+
+from metrics import get_metrics
+
+MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 60.0
+# Anything slower than this gets printed so it shows up in the logs
+SLOW_TASK = 5.0
+
+
+class TaskLatency:
+    """
+    Running latency numbers for one kind of task. waited is time spent queued for a worker
+    or the database lock, ran is time spent actually running.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.failures = 0
+        self.timeouts = 0
+        # Dropped without running, they were still waiting when the caller gave up
+        self.expired = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.waited = 0.0
+
+    def record(self, ran: float, waited: float) -> None:
+        self.count += 1
+        self.total += ran
+        self.max = max(self.max, ran)
+        self.last = ran
+        self.waited += waited
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def __repr__(self):
+        return (f"{self.name}: {self.count} runs, mean {self.mean * 1000:.0f} ms, max {self.max * 1000:.0f} ms, "
+                f"last {self.last * 1000:.0f} ms, {self.failures} failed, {self.timeouts} timed out, {self.expired} expired")
+
+
+class BlockingPool:
+    """
+    Runs the blocking parts of the bot (requests calls, SQLAlchemy queries) on a small thread pool
+    so the discord event loop and its heartbeat never wait on them. A league's database session
+    isn't thread safe, so a task touching it is run holding that league's lock (DatabaseHelper.lock).
+    """
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking")
+        self.latency: dict[str, TaskLatency] = {}
+
+    def _stats(self, name: str) -> TaskLatency:
+        if name not in self.latency:
+            self.latency[name] = TaskLatency(name)
+        return self.latency[name]
+
+    def _call(self, name: str, submitted: float, deadline: float, lock: "threading.RLock | None", func: Callable, args: tuple, kwargs: dict):
+        # The caller stops waiting at deadline, so don't wait on the lock past it or start the task after it
+        acquired = lock is not None and lock.acquire(timeout=max(deadline - time.perf_counter(), 0))
+        try:
+            started = time.perf_counter()
+            if (lock is not None and not acquired) or started > deadline:
+                self._stats(name).expired += 1
+                get_metrics().count("task_expired", task=name)
+                raise TimeoutError(f"{name} waited {started - submitted:.1f}s, past its timeout, not running it")
+            with get_metrics().maybe_profile(name):
+                result = func(*args, **kwargs)
+            ran = time.perf_counter() - started
+            self._stats(name).record(ran, started - submitted)
+            get_metrics().observe("task_seconds", ran, task=name)
+            get_metrics().observe("task_wait_seconds", started - submitted, task=name)
+            if ran > SLOW_TASK:
+                print(f"Slow task {self._stats(name)}")
+            return result
+        finally:
+            if acquired:
+                lock.release()
+
+    async def run(self, name: str, func: Callable, *args, timeout: float = DEFAULT_TIMEOUT, lock: "threading.RLock | None" = None, **kwargs):
+        """
+        Run func(*args, **kwargs) on the pool and wait for it, giving up after timeout seconds,
+        holding lock for the whole call if one is given. A call that times out while running keeps
+        going in its thread (python can't kill it), but one still queued for a worker or the lock
+        by then is dropped without running.
+        """
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        future = loop.run_in_executor(self.executor, self._call, name, submitted, submitted + timeout, lock, func, args, kwargs)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._stats(name).timeouts += 1
+            get_metrics().count("task_timeouts", task=name)
+            print(f"{name} timed out after {timeout}s")
+            raise
+        except Exception:
+            self._stats(name).failures += 1
+            raise
+
+    def report(self) -> str:
+        return "\n".join(repr(stats) for stats in sorted(self.latency.values(), key=lambda _s: _s.name))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)